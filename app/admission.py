@@ -0,0 +1,236 @@
+"""Admission control for Ollama generations.
+
+At most ADMISSION_MAX_CONCURRENT generations run at once, either in this worker
+(ADMISSION_SCOPE=worker) or across every worker on the host (ADMISSION_SCOPE=host).
+Host scope uses one flock'ed slot file per allowed generation in
+ADMISSION_LOCK_DIR. Requests beyond the limit wait in a bounded priority queue.
+A full queue is rejected at once with 429. A request still queued at its deadline
+gets 503. Both carry a Retry-After estimated from recent generation times.
+
+Only the generation is admitted: cached and coalesced answers never queue.
+"""
+import asyncio
+import fcntl
+import heapq
+import itertools
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from app import metrics
+
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "2"))  # 0 disables admission control
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+ADMISSION_SCOPE = os.getenv("ADMISSION_SCOPE", "worker").lower()  # worker | host
+# Host-local on purpose: flock is unreliable on network filesystems such as the index volume.
+ADMISSION_LOCK_DIR = os.getenv("ADMISSION_LOCK_DIR", "/tmp/rag-admission")
+# Prompts estimated below this many tokens are admitted ahead of longer ones.
+ADMISSION_SHORT_PROMPT_TOKENS = int(os.getenv("ADMISSION_SHORT_PROMPT_TOKENS", "512"))
+# How often a worker re-checks for a free host slot while requests are queued.
+HOST_SLOT_POLL_S = 0.02
+
+PRIORITY_SHORT = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BATCH = 2
+_PRIORITY_NAMES = {PRIORITY_SHORT: "short", PRIORITY_NORMAL: "normal", PRIORITY_BATCH: "batch"}
+
+
+class Overloaded(Exception):
+    """Raised instead of queueing (429) or after waiting too long (503)."""
+
+    def __init__(self, status_code: int, retry_after: int, reason: str):
+        super().__init__(f"Server overloaded ({reason}); retry after {retry_after}s")
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+def priority_for(prompt_tokens: Optional[int], batch: bool = False) -> int:
+    if batch:
+        return PRIORITY_BATCH
+    if prompt_tokens is not None and prompt_tokens < ADMISSION_SHORT_PROMPT_TOKENS:
+        return PRIORITY_SHORT
+    return PRIORITY_NORMAL
+
+
+class _HostSlots:
+    """Slot files shared by every worker on the host; a slot is held by flock."""
+
+    def __init__(self, lock_dir: str, slots: int):
+        os.makedirs(lock_dir, exist_ok=True)
+        self.paths = [os.path.join(lock_dir, f"slot-{i}.lock") for i in range(slots)]
+
+    def try_acquire(self):
+        for path in self.paths:
+            f = open(path, "a")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return f
+            except BlockingIOError:
+                f.close()
+        return None
+
+    @staticmethod
+    def release(handle):
+        handle.close()  # closing drops the flock
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float,
+                 scope: str = "worker", lock_dir: str = ADMISSION_LOCK_DIR):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.scope = scope
+        self._host = _HostSlots(lock_dir, max_concurrent) if scope == "host" and max_concurrent > 0 else None
+        self.active = 0
+        # (priority, seq, future); entries whose future is done are stale and skipped.
+        self._waiters = []
+        self._seq = itertools.count()
+        self._poll = None
+        self._hold_times = deque(maxlen=100)
+        self._waits = deque(maxlen=1000)
+        self.admitted = 0
+        self.rejected_full = 0
+        self.timed_out = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrent > 0
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    def retry_after(self) -> int:
+        """Seconds until a new request would probably get a slot."""
+        hold = sorted(self._hold_times)[len(self._hold_times) // 2] if self._hold_times else 5.0
+        return max(1, math.ceil((self.queued + 1) * hold / max(1, self.max_concurrent)))
+
+    def _try_take(self):
+        """A slot token (host lock handle, or True) if one is free right now."""
+        if self.active >= self.max_concurrent:
+            return None
+        if self._host is None:
+            return True
+        return self._host.try_acquire()
+
+    def _give_back(self, token):
+        if self._host is not None and token is not True:
+            self._host.release(token)
+
+    def _dispatch(self):
+        if self._poll is not None:
+            self._poll.cancel()
+            self._poll = None
+        while self._waiters:
+            _, _, fut = self._waiters[0]
+            if fut.done():
+                heapq.heappop(self._waiters)
+                continue
+            token = self._try_take()
+            if token is None:
+                break
+            heapq.heappop(self._waiters)
+            self.active += 1
+            fut.set_result(token)
+        if self._host is not None and self.queued and self.active < self.max_concurrent:
+            # The host slots are held by other workers; nothing will wake us, so poll.
+            self._poll = asyncio.get_running_loop().call_later(HOST_SLOT_POLL_S, self._dispatch)
+
+    def _release(self, token, held_s: Optional[float] = None):
+        self.active -= 1
+        self._give_back(token)
+        if held_s is not None:
+            self._hold_times.append(held_s)
+        self._dispatch()
+
+    async def _acquire(self, priority: int, timeout: Optional[float]):
+        start = time.perf_counter()
+        if not self.queued:
+            token = self._try_take()
+            if token is not None:
+                self.active += 1
+                self._admitted(priority, 0.0)
+                return token
+        if self.queued >= self.max_queue:
+            self.rejected_full += 1
+            metrics.ADMISSION_REJECTED.labels(reason="queue_full").inc()
+            raise Overloaded(429, self.retry_after(), "queue full")
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        if self._host is not None:
+            self._dispatch()
+        timeout = self.queue_timeout if timeout is None else min(timeout, self.queue_timeout)
+        try:
+            token = await asyncio.wait_for(asyncio.shield(fut), timeout)
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled():
+                # Granted in the same tick the deadline fired; hand the slot back.
+                self._release(fut.result())
+            fut.cancel()
+            self.timed_out += 1
+            metrics.ADMISSION_REJECTED.labels(reason="timeout").inc()
+            raise Overloaded(503, self.retry_after(), "queue timeout")
+        except BaseException:
+            if fut.done() and not fut.cancelled():
+                self._release(fut.result())
+            fut.cancel()
+            raise
+        self._admitted(priority, time.perf_counter() - start)
+        return token
+
+    def _admitted(self, priority: int, waited: float):
+        self.admitted += 1
+        self._waits.append(waited)
+        metrics.ADMISSION_WAIT_SECONDS.labels(priority=_PRIORITY_NAMES[priority]).observe(waited)
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_NORMAL, timeout: Optional[float] = None):
+        """Hold a generation slot for the duration of the block."""
+        if not self.enabled:
+            yield
+            return
+        token = await self._acquire(priority, timeout)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(token, time.perf_counter() - start)
+
+    def stats(self) -> dict:
+        waits = sorted(self._waits)
+
+        def pct(q):
+            return round(waits[min(len(waits) - 1, int(q * len(waits)))], 4) if waits else None
+
+        return {
+            "enabled": self.enabled,
+            "scope": self.scope,
+            "max_concurrent": self.max_concurrent,
+            "active": self.active,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_full,
+            "timed_out": self.timed_out,
+            "wait_p50_s": pct(0.5),
+            "wait_p95_s": pct(0.95),
+            "wait_max_s": round(waits[-1], 4) if waits else None,
+            "retry_after_s": self.retry_after(),
+        }
+
+
+_controller = AdmissionController(ADMISSION_MAX_CONCURRENT, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT,
+                                  ADMISSION_SCOPE)
+metrics.ADMISSION_ACTIVE.set_function(lambda: _controller.active)
+metrics.ADMISSION_QUEUED.set_function(lambda: _controller.queued)
+
+
+def get_controller() -> AdmissionController:
+    return _controller
@@ -0,0 +1,149 @@
+import os
+import math
+from typing import Optional
+
+import faiss
+import numpy as np
+
+# flat | ivf_flat | ivf_pq | hnsw | sq8
+INDEX_TYPE = os.getenv("INDEX_TYPE", "flat").lower()
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))  # 0 = derive from corpus size
+PQ_M = int(os.getenv("PQ_M", "16"))  # sub-quantizers; must divide the embedding dim
+PQ_NBITS = int(os.getenv("PQ_NBITS", "8"))
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "80"))
+NPROBE = int(os.getenv("NPROBE", "16"))
+EF_SEARCH = int(os.getenv("EF_SEARCH", "64"))
+# Retrain once the corpus has grown this much since the last training run.
+RETRAIN_GROWTH = float(os.getenv("RETRAIN_GROWTH", "2.0"))
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw", "sq8")
+# faiss warns below ~39 training points per centroid.
+TRAIN_POINTS_PER_CENTROID = 39
+MIN_SQ_TRAIN = 1000
+
+
+def nlist_for(n: int) -> int:
+    if IVF_NLIST > 0:
+        return IVF_NLIST
+    return max(16, int(4 * math.sqrt(max(n, 1))))
+
+
+def min_train_size(index_type: str, n: int) -> int:
+    """Vectors needed before `index_type` can be trained; 0 if it needs no training."""
+    if index_type in ("ivf_flat", "ivf_pq"):
+        need = nlist_for(n) * TRAIN_POINTS_PER_CENTROID
+        if index_type == "ivf_pq":
+            need = max(need, (1 << PQ_NBITS) * TRAIN_POINTS_PER_CENTROID)
+        return need
+    if index_type == "sq8":
+        return MIN_SQ_TRAIN
+    return 0
+
+
+def _create(index_type: str, dim: int, n: int):
+    if index_type == "flat":
+        return faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+    if index_type == "sq8":
+        return faiss.IndexIDMap2(faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit))
+    if index_type == "hnsw":
+        inner = faiss.IndexHNSWFlat(dim, HNSW_M)
+        inner.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        return faiss.IndexIDMap2(inner)
+    if index_type in ("ivf_flat", "ivf_pq"):
+        nlist = nlist_for(n)
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivf_flat":
+            ivf = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        else:
+            ivf = faiss.IndexIVFPQ(quantizer, dim, nlist, PQ_M, PQ_NBITS)
+        # IVF stores ids natively (IndexIDMap's remove_ids assumes a flat sub-index);
+        # the hashtable direct map keeps reconstruct() and remove_ids() working.
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+        return ivf
+    raise ValueError(f"Unknown INDEX_TYPE {index_type!r}; expected one of {INDEX_TYPES}")
+
+
+def effective_type(index_type: str, n: int) -> str:
+    """Indexes start out flat until there is enough data to train the configured type."""
+    if n < min_train_size(index_type, n):
+        return "flat"
+    return index_type
+
+
+def build(vectors: np.ndarray, ids: np.ndarray, index_type: str = INDEX_TYPE):
+    """Build (and train if needed) an index of `index_type` holding `vectors` under `ids`."""
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n, dim = vectors.shape
+    kind = effective_type(index_type, n)
+    index = _create(kind, dim, n)
+    if not index.is_trained:
+        index.train(vectors)
+    if n:
+        index.add_with_ids(vectors, np.ascontiguousarray(ids, dtype="int64"))
+    return index, kind
+
+
+def empty(dim: int, index_type: str = INDEX_TYPE):
+    return build(np.zeros((0, dim), dtype="float32"), np.zeros(0, dtype="int64"), index_type)
+
+
+def needs_rebuild(current_kind: str, trained_ntotal: int, ntotal: int, index_type: str = INDEX_TYPE) -> bool:
+    """True when the index should be rebuilt: first training point reached or corpus outgrew it."""
+    if effective_type(index_type, ntotal) != current_kind:
+        return True
+    if min_train_size(current_kind, ntotal) == 0:
+        return False
+    return ntotal >= trained_ntotal * RETRAIN_GROWTH
+
+
+def supports_remove(index) -> bool:
+    """HNSW graphs cannot delete nodes; those are compacted by rebuilding."""
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    return not isinstance(inner, faiss.IndexHNSW)
+
+
+def reconstruct(index, ids: np.ndarray) -> np.ndarray:
+    """Stored vectors for `ids` (approximate for PQ / SQ codes)."""
+    ids = np.ascontiguousarray(ids, dtype="int64")
+    if len(ids) == 0:
+        return np.zeros((0, index.d), dtype="float32")
+    return index.reconstruct_batch(ids)
+
+
+def exclude_selector(ids):
+    """ID selector matching everything but `ids` (e.g. tombstones), or None if there are none."""
+    if len(ids) == 0:
+        return None
+    batch = faiss.IDSelectorBatch(np.ascontiguousarray(ids, dtype="int64"))
+    sel = faiss.IDSelectorNot(batch)
+    sel.referenced_objects = [batch]  # IDSelectorNot only holds a raw pointer
+    return sel
+
+
+def search_params(index, nprobe: Optional[int] = None, ef_search: Optional[int] = None, sel=None):
+    """Per-call search parameters, so concurrent queries can use different settings.
+
+    `sel` restricts the ids that can be returned (IndexIDMap2 applies it to the outer ids).
+    """
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(nprobe=min(nprobe or NPROBE, inner.nlist), sel=sel)
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=ef_search or EF_SEARCH, sel=sel)
+    if sel is not None:
+        return faiss.SearchParameters(sel=sel)
+    return None
+
+
+def search(index, x: np.ndarray, k: int, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+           sel=None):
+    params = search_params(index, nprobe, ef_search, sel)
+    if params is None:
+        return index.search(x, k)
+    return index.search(x, k, params=params)
+
+
+def describe(index) -> str:
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    return type(inner).__name__
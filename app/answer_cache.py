@@ -0,0 +1,108 @@
+import re
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+import numpy as np
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """Case, whitespace and trailing-punctuation insensitive form of a question."""
+    return _WS_RE.sub(" ", question.strip().lower()).rstrip(" ?!.")
+
+
+class AnswerCache:
+    """LRU + TTL cache of generated answers for one index generation.
+
+    Entries are looked up by exact key and, when `similarity` > 0, by cosine
+    similarity of the question embedding among entries with the same search
+    parameters. Moving to a new index generation drops every entry; lookups
+    and puts for an older generation (requests that started before the swap)
+    are ignored.
+    """
+
+    def __init__(self, max_entries: int, ttl_s: float, similarity: float = 0.0):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.similarity = similarity
+        self.generation = None
+        self._entries: "OrderedDict[Hashable, Tuple[float, str, Hashable, Optional[np.ndarray]]]" = OrderedDict()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _sync(self, generation: int) -> bool:
+        """Follow `generation` forward; False if it is older than the cached one."""
+        if self.generation is not None and generation < self.generation:
+            return False
+        if generation != self.generation:
+            self._entries.clear()
+            self.generation = generation
+        return True
+
+    def get(self, generation: int, key: Hashable) -> Optional[str]:
+        if not self.enabled or not self._sync(generation):
+            return None
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def get_similar(self, generation: int, params: Hashable, embedding: np.ndarray) -> Optional[str]:
+        """Best cached answer whose question embedding is within the similarity threshold."""
+        if not self.enabled or self.similarity <= 0 or embedding is None or not self._sync(generation):
+            return None
+        now = time.monotonic()
+        q = _unit(embedding)
+        best_key, best_sim = None, self.similarity
+        for key, (expires, _, entry_params, vec) in self._entries.items():
+            if vec is None or entry_params != params or expires < now:
+                continue
+            sim = float(np.dot(q, vec))
+            if sim >= best_sim:
+                best_key, best_sim = key, sim
+        if best_key is None:
+            return None
+        self._entries.move_to_end(best_key)
+        self.similar_hits += 1
+        return self._entries[best_key][1]
+
+    def miss(self):
+        self.misses += 1
+
+    def put(self, generation: int, key: Hashable, params: Hashable, answer: str,
+            embedding: Optional[np.ndarray] = None):
+        if not self.enabled or not self._sync(generation):
+            return
+        vec = _unit(embedding) if embedding is not None and self.similarity > 0 else None
+        self._entries[key] = (time.monotonic() + self.ttl_s, answer, params, vec)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.similar_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "generation": self.generation,
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.similar_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+def _unit(v: np.ndarray) -> np.ndarray:
+    v = np.asarray(v, dtype="float32").ravel()
+    n = np.linalg.norm(v)
+    return v / n if n else v
@@ -0,0 +1,134 @@
+import os
+import hashlib
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # optional: fall back to plain polling
+    Observer = None
+    FileSystemEventHandler = object
+
+SUPPORTED_EXTENSIONS = ("txt", "docx", "pdf")
+
+
+#Hash method to get file hash
+def get_file_hash(path: str) -> str:
+    """Generate an md5 hash for the file contents."""
+    h = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(8192), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class FileState(NamedTuple):
+    size: int
+    mtime_ns: int
+    inode: int
+    hash: str
+
+
+class ChangeSet(NamedTuple):
+    new: List[str]
+    updated: List[str]
+    deleted: List[str]
+    manifest: Dict[str, FileState]
+    hashed: int
+    scan_seconds: float
+
+    def is_empty(self) -> bool:
+        return not (self.new or self.updated or self.deleted)
+
+
+def _same_stat(state, st: os.stat_result) -> bool:
+    # Legacy manifests stored only the md5 string; those always get re-hashed once.
+    if not isinstance(state, FileState):
+        return False
+    return (state.size == st.st_size and state.mtime_ns == st.st_mtime_ns
+            and state.inode == st.st_ino)
+
+
+def _stored_hash(state) -> Optional[str]:
+    if isinstance(state, FileState):
+        return state.hash
+    return state
+
+
+def iter_documents(data_dir: str):
+    """Yield paths of supported documents anywhere under data_dir."""
+    for root, dirs, files in os.walk(data_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(files):
+            if name.lower().split('.')[-1] in SUPPORTED_EXTENSIONS:
+                yield os.path.join(root, name)
+
+
+def scan(data_dir: str, previous: Dict[str, object]) -> ChangeSet:
+    """Diff DATA_DIR (recursively) against the previous manifest, keyed by relative path.
+
+    Only files whose (size, mtime, inode) changed are re-hashed, and a file whose
+    content hash is unchanged (e.g. touched or copied back) is not reported.
+    """
+    start = time.perf_counter()
+    manifest: Dict[str, FileState] = {}
+    new, updated = [], []
+    hashed = 0
+
+    for path in iter_documents(data_dir):
+        fn = os.path.relpath(path, data_dir)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+
+        old = previous.get(fn)
+        if old is not None and _same_stat(old, st):
+            manifest[fn] = old
+            continue
+
+        try:
+            h = get_file_hash(path)
+        except OSError:
+            # Mid-write or briefly unreadable: keep the old entry (its stat still
+            # differs, so the next scan re-hashes) rather than report a delete.
+            if old is not None:
+                manifest[fn] = old
+            continue
+        hashed += 1
+        manifest[fn] = FileState(st.st_size, st.st_mtime_ns, st.st_ino, h)
+        if old is None:
+            new.append(fn)
+        elif _stored_hash(old) != h:
+            updated.append(fn)
+
+    deleted = [fn for fn in previous if fn not in manifest]
+    return ChangeSet(new, updated, deleted, manifest, hashed, time.perf_counter() - start)
+
+
+class _WakeHandler(FileSystemEventHandler):
+    def __init__(self, wake: threading.Event):
+        self._wake = wake
+
+    def on_any_event(self, event):
+        self._wake.set()
+
+
+def start_event_source(data_dir: str, wake: threading.Event):
+    """Set `wake` on filesystem events (inotify on Linux) when watchdog is installed.
+
+    Returns the observer, or None when the caller should rely on polling alone.
+    """
+    if Observer is None or not os.path.isdir(data_dir):
+        return None
+    try:
+        observer = Observer()
+        observer.schedule(_WakeHandler(wake), data_dir, recursive=True)
+        observer.daemon = True
+        observer.start()
+        return observer
+    except Exception as e:
+        print(f"File event source unavailable, polling only: {e}")
+        return None
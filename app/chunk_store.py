@@ -0,0 +1,177 @@
+"""On-disk chunk store shared by every index generation.
+
+Chunk text lives in SQLite keyed by chunk id (the FAISS id), with file names
+interned in their own table. Query workers fetch only the rows for their top-k
+hits instead of unpickling the whole mapping. Rows are never rewritten: a
+deleted chunk is stamped with the generation it disappears in, so workers still
+serving an older generation keep resolving it until it is purged.
+"""
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+INDEX_DIR = os.getenv("INDEX_PATH", "/index")
+CHUNK_STORE_FILE = os.path.join(INDEX_DIR, "chunks.sqlite")
+
+# Marker strings of the greetings / identity policy document, matched at index time.
+POLICY_MARKERS = [
+    "SYSTEM IDENTITY AND GREETINGS POLICY",
+    "NBS Assistant",
+    "GREETINGS AND BASIC INTERACTIONS",
+    "IDENTITY",
+    "CAPABILITIES",
+]
+
+# Ids / hashes bound per IN (...) query; SQLite's default limit on bound
+# parameters is 999 on older builds.
+SQLITE_PARAM_BATCH = 500
+
+
+def is_policy_chunk(text: str) -> bool:
+    # Markers are compared as written against the upper-cased text, as the query
+    # path always has, so the mixed-case "NBS Assistant" never matches on its own.
+    up = text.upper()
+    return any(m in up for m in POLICY_MARKERS)
+
+
+class Chunk(NamedTuple):
+    id: int
+    file: str
+    seq: int
+    text: str
+
+
+class ChunkStore:
+    def __init__(self, path: str = CHUNK_STORE_FILE, readonly: bool = False):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        if readonly:
+            # Readers still need the WAL's shared-memory file, so not mode=ro.
+            self._conn.execute("PRAGMA query_only = 1")
+        else:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);"
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                " id INTEGER PRIMARY KEY, file_id INTEGER NOT NULL, seq INTEGER NOT NULL,"
+                " text TEXT NOT NULL, policy INTEGER NOT NULL DEFAULT 0, deleted_gen INTEGER);"
+                "CREATE INDEX IF NOT EXISTS chunks_file ON chunks (file_id) WHERE deleted_gen IS NULL;"
+                "CREATE INDEX IF NOT EXISTS chunks_policy ON chunks (id) WHERE policy = 1 AND deleted_gen IS NULL;"
+                "CREATE INDEX IF NOT EXISTS chunks_deleted ON chunks (deleted_gen) WHERE deleted_gen IS NOT NULL;"
+            )
+            self._conn.commit()
+        self._file_ids: Dict[str, int] = {}
+
+    # -- writer ---------------------------------------------------------------
+
+    def _file_id(self, name: str) -> int:
+        fid = self._file_ids.get(name)
+        if fid is None:
+            self._conn.execute("INSERT OR IGNORE INTO files (name) VALUES (?)", (name,))
+            fid = self._conn.execute("SELECT id FROM files WHERE name = ?", (name,)).fetchone()[0]
+            self._file_ids[name] = fid
+        return fid
+
+    def add_chunks(self, rows: Iterable[Tuple[int, str, int, str]]):
+        """Append (id, file, seq, text) rows; ids left by an unpublished run are overwritten."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, file_id, seq, text, policy, deleted_gen)"
+                " VALUES (?, ?, ?, ?, ?, NULL)",
+                [(cid, self._file_id(fn), seq, text, int(is_policy_chunk(text))) for cid, fn, seq, text in rows],
+            )
+
+    def delete_file(self, name: str, generation: int) -> List[int]:
+        """Mark a file's live chunks deleted as of `generation`; returns their ids."""
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM files WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                return []
+            ids = [r[0] for r in self._conn.execute(
+                "SELECT id FROM chunks WHERE file_id = ? AND deleted_gen IS NULL ORDER BY id", (row[0],))]
+            self._conn.execute(
+                "UPDATE chunks SET deleted_gen = ? WHERE file_id = ? AND deleted_gen IS NULL", (generation, row[0]))
+            return ids
+
+    def delete_all(self, generation: int) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE chunks SET deleted_gen = ? WHERE deleted_gen IS NULL", (generation,)).rowcount
+
+    def purge(self, up_to_generation: int) -> int:
+        """Physically remove rows deleted in generations no reader can still be on."""
+        with self._lock:
+            n = self._conn.execute(
+                "DELETE FROM chunks WHERE deleted_gen IS NOT NULL AND deleted_gen <= ?", (up_to_generation,)).rowcount
+            self._conn.commit()
+            return n
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+    def rollback(self):
+        """Discard writes since the last commit."""
+        with self._lock:
+            self._conn.rollback()
+
+    def live_ids(self) -> List[int]:
+        with self._lock:
+            return [r[0] for r in self._conn.execute("SELECT id FROM chunks WHERE deleted_gen IS NULL ORDER BY id")]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks WHERE deleted_gen IS NULL").fetchone()[0]
+
+    def max_id(self) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(id) FROM chunks").fetchone()
+            return row[0] if row[0] is not None else -1
+
+    def policy_chunk_id(self) -> Optional[int]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(id) FROM chunks WHERE policy = 1 AND deleted_gen IS NULL").fetchone()
+            return row[0]
+
+    def import_mapping(self, chunk_mapping: Dict[int, dict]):
+        """One-off import of an in-memory {id: {"file", "text"}} mapping."""
+        seqs: Dict[str, int] = {}
+        rows = []
+        for cid in sorted(chunk_mapping):
+            c = chunk_mapping[cid]
+            seq = seqs.get(c["file"], 0)
+            seqs[c["file"]] = seq + 1
+            rows.append((cid, c["file"], seq, c["text"]))
+        self.add_chunks(rows)
+        self.commit()
+
+    # -- reader ---------------------------------------------------------------
+
+    def get_many(self, ids: Sequence[int], generation: Optional[int] = None) -> Dict[int, Chunk]:
+        """Chunks for `ids` that are visible in `generation` (all live ones if None)."""
+        ids = [int(i) for i in ids if i >= 0]
+        out: Dict[int, Chunk] = {}
+        with self._lock:
+            for i in range(0, len(ids), SQLITE_PARAM_BATCH):
+                part = ids[i:i + SQLITE_PARAM_BATCH]
+                query = (
+                    "SELECT c.id, f.name, c.seq, c.text FROM chunks c JOIN files f ON f.id = c.file_id"
+                    f" WHERE c.id IN ({','.join('?' * len(part))})"
+                )
+                if generation is None:
+                    query += " AND c.deleted_gen IS NULL"
+                    args = part
+                else:
+                    query += " AND (c.deleted_gen IS NULL OR c.deleted_gen > ?)"
+                    args = [*part, generation]
+                for cid, name, seq, text in self._conn.execute(query, args):
+                    out[cid] = Chunk(cid, name, seq, text)
+        return out
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
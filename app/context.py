@@ -0,0 +1,228 @@
+"""Context assembly: turn the raw FAISS hits for a question into prompt context.
+
+Stages, in order:
+  1. distance cutoff    drop hits further than CONTEXT_MAX_DISTANCE (the best hit is always kept)
+  2. near-duplicates    drop hits whose stored vector is within CONTEXT_DEDUP_SIMILARITY (cosine)
+                        of a better one; word-shingle Jaccard when vectors are unavailable
+  3. MMR                pick up to CONTEXT_MAX_CHUNKS hits trading relevance against redundancy
+  4. merge              join selected chunks that are adjacent in the same file into one passage
+  5. token budget       add passages until the budget is spent, truncating the last one
+
+Token counts are estimates (see estimate_tokens); Ollama's prompt_eval_count in
+the generation stats is the exact figure.
+"""
+import os
+import re
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from app import ann, metrics
+from app.chunk_store import Chunk
+
+# L2 distance (squared, as FAISS returns it); for normalised embeddings 2 - 2 * cosine.
+# 0 disables the cutoff.
+CONTEXT_MAX_DISTANCE = float(os.getenv("CONTEXT_MAX_DISTANCE", "1.5"))
+CONTEXT_DEDUP_SIMILARITY = float(os.getenv("CONTEXT_DEDUP_SIMILARITY", "0.95"))
+CONTEXT_DEDUP_JACCARD = float(os.getenv("CONTEXT_DEDUP_JACCARD", "0.8"))
+# 1.0 = pure relevance order, lower values favour diversity.
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+# Hits retrieved as MMR candidates, and the most that end up in the prompt.
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "20"))
+CONTEXT_MAX_CHUNKS = int(os.getenv("CONTEXT_MAX_CHUNKS", "5"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# A truncated passage shorter than this is left out instead.
+MIN_PASSAGE_TOKENS = 32
+SHINGLE_SIZE = 3
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_END_RE = re.compile(r"[.!?]\s")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough BPE token count: words and punctuation, long words counted as several pieces."""
+    return sum(1 + len(t) // 8 for t in _TOKEN_RE.findall(text))
+
+
+def truncate_tokens(text: str, budget: int) -> str:
+    """Longest prefix within `budget` estimated tokens, cut at a sentence end when possible."""
+    used = 0
+    end = 0
+    for m in _TOKEN_RE.finditer(text):
+        used += 1 + len(m.group()) // 8
+        if used > budget:
+            break
+        end = m.end()
+    prefix = text[:end]
+    cut = max((m.end() for m in _SENTENCE_END_RE.finditer(prefix)), default=0)
+    # Only back off to a sentence end if that keeps most of the text.
+    return prefix[:cut].rstrip() if cut > len(prefix) // 2 else prefix
+
+
+class Passage(NamedTuple):
+    file: str
+    chunk_ids: List[int]
+    text: str
+    distance: float
+
+
+class AssembledContext(NamedTuple):
+    passages: List[Passage]
+    text: str
+    stats: Dict[str, object]
+
+
+def _shingles(text: str) -> set:
+    words = text.lower().split()
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def _jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def _unit_rows(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.where(norms > 0, norms, 1.0)
+
+
+def _vectors(index, ids: Sequence[int]) -> Optional[np.ndarray]:
+    """Stored vectors for the hits, or None if this index cannot reconstruct them."""
+    if index is None:
+        return None
+    try:
+        return _unit_rows(ann.reconstruct(index, np.asarray(ids, dtype="int64")))
+    except RuntimeError:
+        return None
+
+
+def _dedup(order: List[int], chunks: List[Chunk], vectors: Optional[np.ndarray]) -> List[int]:
+    kept: List[int] = []
+    shingles = {} if vectors is None else None
+    for i in order:
+        if vectors is not None:
+            duplicate = any(float(vectors[i] @ vectors[j]) >= CONTEXT_DEDUP_SIMILARITY for j in kept)
+        else:
+            shingles[i] = _shingles(chunks[i].text)
+            duplicate = any(_jaccard(shingles[i], shingles[j]) >= CONTEXT_DEDUP_JACCARD for j in kept)
+        if not duplicate:
+            kept.append(i)
+    return kept
+
+
+def _mmr(order: List[int], relevance: np.ndarray, vectors: Optional[np.ndarray], k: int,
+         lam: float) -> List[int]:
+    if vectors is None or lam >= 1.0 or len(order) <= 1:
+        return order[:k]
+    selected = [order[0]]
+    remaining = order[1:]
+    while remaining and len(selected) < k:
+        sims = vectors[remaining] @ vectors[selected].T
+        scores = lam * relevance[remaining] - (1 - lam) * sims.max(axis=1)
+        selected.append(remaining.pop(int(np.argmax(scores))))
+    return selected
+
+
+def _merge_adjacent(selected: List[int], chunks: List[Chunk], distances: np.ndarray) -> List[Passage]:
+    """Group selected chunks that are consecutive in one file, in selection order of their best member."""
+    # Chunk.seq is the chunk's position in its file, so seq + 1 is the next chunk.
+    position = {i: chunks[i].seq for i in selected}
+    by_file: Dict[str, List[int]] = {}
+    for i in selected:
+        by_file.setdefault(chunks[i].file, []).append(i)
+
+    groups = []
+    for members in by_file.values():
+        members.sort(key=lambda i: position[i])
+        run = [members[0]]
+        for i in members[1:]:
+            if position[i] == position[run[-1]] + 1:
+                run.append(i)
+            else:
+                groups.append(run)
+                run = [i]
+        groups.append(run)
+
+    rank = {i: r for r, i in enumerate(selected)}
+    groups.sort(key=lambda g: min(rank[i] for i in g))
+    # Adjacent chunks are contiguous slices of the document, so they join without a separator.
+    return [Passage(chunks[g[0]].file, [chunks[i].id for i in g], "".join(chunks[i].text for i in g),
+                    float(min(distances[i] for i in g)))
+            for g in groups]
+
+
+def assemble(distances: Sequence[float], ids: Sequence[int], chunks: Dict[int, Chunk], index=None,
+             max_tokens: Optional[int] = None, max_chunks: int = CONTEXT_MAX_CHUNKS) -> AssembledContext:
+    """Build prompt context from one question's search results.
+
+    `distances` / `ids` are a FAISS result row, `chunks` the fetched rows for
+    those ids and `index` the index they came from (for stored vectors).
+    """
+    budget = max_tokens if max_tokens is not None else CONTEXT_TOKEN_BUDGET
+    hits = [(float(d), int(i)) for d, i in zip(distances, ids) if int(i) in chunks]
+    hit_chunks = [chunks[i] for _, i in hits]
+    hit_distances = np.array([d for d, _ in hits], dtype="float32")
+    stats: Dict[str, object] = {"candidates": len(hits)}
+
+    order = list(range(len(hits)))
+    if CONTEXT_MAX_DISTANCE > 0:
+        order = [i for i in order if i == 0 or hit_distances[i] <= CONTEXT_MAX_DISTANCE]
+    stats["after_cutoff"] = len(order)
+
+    vectors = _vectors(index, [c.id for c in hit_chunks]) if order else None
+    order = _dedup(order, hit_chunks, vectors)
+    stats["after_dedup"] = len(order)
+
+    # Relevance in [0, 1] on the same scale as the cosine redundancy term.
+    relevance = 1.0 - hit_distances / 2.0
+    selected = _mmr(order, relevance, vectors, max_chunks, CONTEXT_MMR_LAMBDA)
+    stats["selected"] = len(selected)
+
+    passages = _merge_adjacent(selected, hit_chunks, hit_distances) if selected else []
+    stats["passages"] = len(passages)
+
+    kept: List[Passage] = []
+    used = 0
+    truncated = False
+    for p in passages:
+        tokens = estimate_tokens(p.text)
+        if used + tokens <= budget:
+            kept.append(p)
+            used += tokens
+            continue
+        remaining = budget - used
+        if remaining >= MIN_PASSAGE_TOKENS or not kept:
+            text = truncate_tokens(p.text, max(0, remaining))
+            if text:
+                kept.append(p._replace(text=text))
+                used += estimate_tokens(text)
+        truncated = True
+        break
+
+    text = "\n\n".join(p.text for p in kept)
+    stats.update({
+        "used": len(kept),
+        "truncated": truncated,
+        "context_tokens": used,
+        "budget": budget,
+    })
+    return AssembledContext(kept, text, stats)
+
+
+def candidate_k() -> int:
+    """How many hits to retrieve so the later stages have something to choose from."""
+    return max(CONTEXT_CANDIDATES, CONTEXT_MAX_CHUNKS)
+
+
+def context_summary(recent: Sequence[Dict[str, object]]) -> Dict[str, Optional[float]]:
+    """Medians over recent assembly stats, for /stats."""
+    return {
+        "count": len(recent),
+        "median_candidates": metrics.median(recent, "candidates"),
+        "median_used": metrics.median(recent, "used"),
+        "median_context_tokens": metrics.median(recent, "context_tokens"),
+        "median_prompt_tokens_estimate": metrics.median(recent, "prompt_tokens_estimate"),
+        "truncated": sum(1 for r in recent if r.get("truncated")),
+    }
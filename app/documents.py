@@ -0,0 +1,83 @@
+"""Document readers and chunking.
+
+Kept free of model / index imports so extraction worker processes start cheaply.
+"""
+import os
+import re
+import zlib
+from collections import deque
+
+from docx import Document as DocxDocument
+import PyPDF2
+
+CHUNK_SIZE = 500  # tokens or approx characters
+# fixed: CHUNK_SIZE-character slices. cdc: content-defined boundaries that stay put
+# when text earlier in the document is edited, so unchanged chunks hit the embedding cache.
+CHUNK_MODE = os.getenv("CHUNK_MODE", "fixed").lower()
+CDC_WINDOW = 4  # words hashed to decide a boundary
+
+_WORD_RE = re.compile(r"\S+\s*")
+
+def read_text_file(path: str) -> str:
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        return f.read()
+
+def read_docx_file(path: str) -> str:
+    doc = DocxDocument(path)
+    return "\n".join([p.text for p in doc.paragraphs if p.text.strip()])
+
+def read_pdf_file(path: str) -> str:
+    text = []
+    with open(path, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        for page in reader.pages:
+            text.append(page.extract_text())
+    return "\n".join(filter(None, text))
+
+def read_file(path: str) -> str:
+    ext = path.lower().split('.')[-1]
+    if ext == "txt":
+        return read_text_file(path)
+    if ext == "docx":
+        return read_docx_file(path)
+    if ext == "pdf":
+        return read_pdf_file(path)
+    raise ValueError(f"Unsupported file type: {path}")
+
+def chunk_text_fixed(text: str, size: int = CHUNK_SIZE):
+    """Split text into fixed-size chunks."""
+    return [text[i:i+size] for i in range(0, len(text), size)]
+
+def chunk_text_cdc(text: str, size: int = CHUNK_SIZE):
+    """Split text at content-defined boundaries averaging roughly `size` characters.
+
+    A boundary is placed after a word once the chunk has at least size/2
+    characters and either a paragraph break follows or a hash of the last few
+    words hits. The decision only depends on nearby text, so an edit shifts at
+    most the chunks around it. Chunks are capped at 2 * size characters.
+    """
+    min_size, max_size = size // 2, size * 2
+    divisor = max(1, (size - min_size) // 6)  # ~6 characters per word
+    chunks = []
+    start = 0
+    recent = deque(maxlen=CDC_WINDOW)
+    for m in _WORD_RE.finditer(text):
+        word = m.group()
+        recent.append(word.rstrip())
+        end = m.end()
+        while end - start > max_size:
+            chunks.append(text[start:start + max_size])
+            start += max_size
+        if end - start < min_size:
+            continue
+        if "\n\n" in word or zlib.crc32(" ".join(recent).encode("utf-8")) % divisor == 0:
+            chunks.append(text[start:end])
+            start = end
+    if start < len(text) and text[start:].strip():
+        chunks.append(text[start:])
+    return chunks
+
+def chunk_text(text: str, size: int = CHUNK_SIZE):
+    if CHUNK_MODE == "fixed":
+        return chunk_text_fixed(text, size)
+    return chunk_text_cdc(text, size)
@@ -0,0 +1,122 @@
+"""Persistent embedding cache keyed by (model name, chunk-content hash).
+
+Re-indexing an edited document only pays for embedding chunks whose text is
+new; unchanged chunks are read back from SQLite.
+
+Every chunk version ever embedded would otherwise stay on disk (about 1.5 KB per
+chunk for MiniLM), so entries record when they were last used and prune() drops
+the least recently used ones beyond a size bound. Entries of a model no longer in
+use are never hit again and age out the same way.
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.chunk_store import SQLITE_PARAM_BATCH
+
+
+def content_hash(text: str) -> bytes:
+    return hashlib.sha1(text.encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    def __init__(self, path: str, model_name: str):
+        self.path = path
+        self.model_name = model_name
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, hash BLOB NOT NULL, dim INTEGER NOT NULL, vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, hash)) WITHOUT ROWID"
+        )
+        columns = [r[1] for r in self._conn.execute("PRAGMA table_info(embeddings)")]
+        if "last_used" not in columns:
+            # Caches written before pruning existed count as least recently used.
+            self._conn.execute("ALTER TABLE embeddings ADD COLUMN last_used INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    def lookup(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Cached vectors for `texts`, None where missing. Does not touch hit counters."""
+        hashes = [content_hash(t) for t in texts]
+        found: Dict[bytes, np.ndarray] = {}
+        with self._lock:
+            unique = list(set(hashes))
+            for i in range(0, len(unique), SQLITE_PARAM_BATCH):
+                part = unique[i:i + SQLITE_PARAM_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT hash, dim, vector FROM embeddings WHERE model = ? AND hash IN ({','.join('?' * len(part))})",
+                    [self.model_name, *part],
+                )
+                for h, dim, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype="float32", count=dim)
+        return [found.get(h) for h in hashes]
+
+    def encode(self, texts: Sequence[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Embed `texts`, calling `encode_fn` only for cache misses."""
+        cached = self.lookup(texts)
+        missing = [i for i, v in enumerate(cached) if v is None]
+        now = int(time.time())
+        hit_hashes = list({content_hash(t) for t, v in zip(texts, cached) if v is not None})
+        if hit_hashes:
+            with self._lock:
+                for i in range(0, len(hit_hashes), SQLITE_PARAM_BATCH):
+                    part = hit_hashes[i:i + SQLITE_PARAM_BATCH]
+                    self._conn.execute(
+                        "UPDATE embeddings SET last_used = ?"
+                        f" WHERE model = ? AND hash IN ({','.join('?' * len(part))})",
+                        [now, self.model_name, *part],
+                    )
+                self._conn.commit()
+        if missing:
+            # Duplicate texts inside one batch are embedded once.
+            todo = list(dict.fromkeys(texts[i] for i in missing))
+            fresh = np.asarray(encode_fn(todo), dtype="float32")
+            by_text = dict(zip(todo, fresh))
+            for i in missing:
+                cached[i] = by_text[texts[i]]
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, hash, dim, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                    [(self.model_name, content_hash(t), v.shape[0], v.tobytes(), now) for t, v in by_text.items()],
+                )
+                self._conn.commit()
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        return np.vstack(cached).astype("float32") if cached else np.zeros((0, 0), dtype="float32")
+
+    def prune(self, max_entries: int) -> int:
+        """Delete the least recently used entries beyond `max_entries` (0 = unbounded); returns how many."""
+        if max_entries <= 0:
+            return 0
+        with self._lock:
+            excess = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] - max_entries
+            if excess <= 0:
+                return 0
+            removed = self._conn.execute(
+                "DELETE FROM embeddings WHERE (model, hash) IN"
+                " (SELECT model, hash FROM embeddings ORDER BY last_used LIMIT ?)", (excess,)).rowcount
+            self._conn.commit()
+            return removed
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,113 @@
+"""Process-wide embedding model shared by the indexer and the query path.
+
+The backend is chosen with EMBEDDING_BACKEND:
+  torch   sentence-transformers on PyTorch, full precision (reference)
+  onnx    sentence-transformers' ONNX Runtime backend; needs `sentence-transformers[onnx]`.
+          The model's exported ONNX file is used, or exported on first load.
+          EMBEDDING_ONNX_FILE picks another file, e.g. onnx/model_qint8_avx512_vnni.onnx.
+  int8    the PyTorch model with its Linear layers dynamically quantized to int8
+
+Nothing heavy is imported until the model is first needed; warm_up() loads it
+and runs one encode so the first request does not pay for it.
+"""
+import os
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "")
+# Intra-op threads per worker process; 0 keeps the library default (all cores).
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+EMBEDDING_WARMUP = os.getenv("EMBEDDING_WARMUP", "1") == "1"
+
+BACKENDS = ("torch", "onnx", "int8")
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def model_id(backend: str = EMBEDDING_BACKEND, model_name: str = EMBEDDING_MODEL) -> str:
+    """Identity of the vectors a backend produces, e.g. for keying cached embeddings."""
+    if backend == "torch":
+        return model_name
+    if backend == "onnx" and EMBEDDING_ONNX_FILE:
+        return f"{model_name}@onnx:{EMBEDDING_ONNX_FILE}"
+    return f"{model_name}@{backend}"
+
+
+def _onnx_kwargs(threads: int) -> dict:
+    kwargs = {"provider": "CPUExecutionProvider"}
+    if EMBEDDING_ONNX_FILE:
+        kwargs["file_name"] = EMBEDDING_ONNX_FILE
+    if threads > 0:
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        kwargs["session_options"] = options
+    return kwargs
+
+
+def load_model(backend: str = EMBEDDING_BACKEND, model_name: str = EMBEDDING_MODEL,
+               threads: int = EMBEDDING_THREADS):
+    """Build a new SentenceTransformer for `backend` (use get_model() for the shared one)."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND {backend!r}; expected one of {BACKENDS}")
+    from sentence_transformers import SentenceTransformer
+
+    if threads > 0 and backend != "onnx":
+        import torch
+
+        torch.set_num_threads(threads)
+
+    if backend == "onnx":
+        try:
+            return SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=_onnx_kwargs(threads))
+        except ImportError as e:
+            raise RuntimeError("EMBEDDING_BACKEND=onnx needs `pip install sentence-transformers[onnx]`") from e
+
+    model = SentenceTransformer(model_name, device="cpu")
+    if backend == "int8":
+        import torch
+
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def get_model():
+    """Load the model on first use; every caller in the process shares it."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                t = time.perf_counter()
+                _model = load_model()
+                print(f"Loaded embedding model {model_id()} in {time.perf_counter() - t:.2f}s")
+    return _model
+
+
+def encode(texts, model=None) -> np.ndarray:
+    model = model if model is not None else get_model()
+    return np.asarray(model.encode(list(texts)), dtype="float32")
+
+
+def warm_up():
+    """Load the model and run one encode (first calls allocate buffers / build kernels)."""
+    try:
+        encode(["warm-up"])
+    except Exception as e:
+        print(f"Embedding warm-up failed: {e}")
+
+
+def start_warm_up() -> Optional[threading.Thread]:
+    """Warm the model up in a daemon thread so worker start-up does not block on it."""
+    if not EMBEDDING_WARMUP:
+        return None
+    t = threading.Thread(target=warm_up, name="embedding-warmup", daemon=True)
+    t.start()
+    return t
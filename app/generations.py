@@ -0,0 +1,228 @@
+import os
+import json
+import pickle
+import shutil
+import tempfile
+import time
+from typing import NamedTuple, Optional
+
+import faiss
+
+from app import metrics
+
+INDEX_DIR = os.getenv("INDEX_PATH", "/index")
+GENERATIONS_DIR = os.path.join(INDEX_DIR, "generations")
+MANIFEST_FILE = os.path.join(INDEX_DIR, "CURRENT.json")
+KEEP_GENERATIONS = int(os.getenv("KEEP_GENERATIONS", "3"))
+
+# Pre-generation layout, still read so existing volumes keep working until the
+# indexer publishes its first generation.
+LEGACY_INDEX_FILE = os.path.join(INDEX_DIR, "faiss.index")
+LEGACY_MAPPING_FILE = os.path.join(INDEX_DIR, "chunk_mapping.pkl")
+
+INDEX_FILENAME = "faiss.index"
+MAPPING_FILENAME = "chunk_mapping.pkl"
+
+# Read-only + mmap lets every gunicorn worker share one page-cache copy of the
+# index. IO_FLAG_MMAP_IFC (flat codes) only exists in newer faiss builds.
+MMAP_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+
+
+# (manifest mtime, published-index figures) for the metrics gauges.
+_published_stats = (None, None)
+
+
+class IndexSnapshot(NamedTuple):
+    generation: int
+    index: object
+    chunk_mapping: object
+    meta: dict
+    # Selector excluding the tombstoned ids, attached by readers that search the index.
+    exclude: object = None
+
+
+def _fsync_file(path: str):
+    with open(path, "rb") as f:
+        os.fsync(f.fileno())
+
+
+def _write_json_atomic(path: str, data: dict):
+    directory = os.path.dirname(path)
+    fd, tmp = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def read_manifest() -> Optional[dict]:
+    """Return the current manifest, or None if no generation was published yet."""
+    try:
+        with open(MANIFEST_FILE, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def manifest_mtime() -> int:
+    """Cheap change check for readers: mtime of the manifest, 0 if missing."""
+    try:
+        return os.stat(MANIFEST_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def generation_path(manifest: dict) -> str:
+    return os.path.join(GENERATIONS_DIR, manifest["path"])
+
+
+def next_generation() -> int:
+    """Number the next publish_generation() call will use (single writer)."""
+    current = read_manifest()
+    return (current["generation"] if current else 0) + 1
+
+
+def publish_generation(index, chunk_mapping=None, meta: Optional[dict] = None) -> int:
+    """Write the index (and a pickled mapping, if given) into a fresh generation
+    directory and flip the manifest.
+
+    Everything is written under a temp directory first, renamed into place and only
+    then referenced from the manifest, so readers never observe a partial generation.
+    `meta` is small JSON-serialisable indexer state stored in the manifest itself.
+    Chunk text normally lives in the shared chunk store, not in the generation.
+    """
+    os.makedirs(GENERATIONS_DIR, exist_ok=True)
+    generation = next_generation()
+    name = f"gen-{generation:08d}"
+
+    tmp_dir = tempfile.mkdtemp(prefix=".tmp-gen-", dir=GENERATIONS_DIR)
+    try:
+        index_file = os.path.join(tmp_dir, INDEX_FILENAME)
+        mapping_file = os.path.join(tmp_dir, MAPPING_FILENAME)
+        faiss.write_index(index, index_file)
+        _fsync_file(index_file)
+        if chunk_mapping is not None:
+            with open(mapping_file, "wb") as f:
+                pickle.dump(chunk_mapping, f)
+            _fsync_file(mapping_file)
+        os.rename(tmp_dir, os.path.join(GENERATIONS_DIR, name))
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    _write_json_atomic(MANIFEST_FILE, {
+        "generation": generation,
+        "path": name,
+        "ntotal": int(index.ntotal),
+        "created_at": time.time(),
+        "meta": meta or {},
+    })
+    prune_generations(generation)
+    return generation
+
+
+def prune_generations(current_generation: int, keep: int = KEEP_GENERATIONS):
+    """Delete old generations and abandoned temp dirs.
+
+    Workers that still have an older generation mapped keep reading it: unlinked
+    files stay valid for as long as they are mapped.
+    """
+    if not os.path.isdir(GENERATIONS_DIR):
+        return
+    for name in os.listdir(GENERATIONS_DIR):
+        path = os.path.join(GENERATIONS_DIR, name)
+        if name.startswith(".tmp-gen-"):
+            # Leftover from a crashed publish; give a concurrent writer time to finish.
+            if time.time() - os.stat(path).st_mtime > 3600:
+                shutil.rmtree(path, ignore_errors=True)
+            continue
+        if not name.startswith("gen-"):
+            continue
+        try:
+            gen = int(name[len("gen-"):])
+        except ValueError:
+            continue
+        if gen <= current_generation - keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _read_index(path: str, mmap: bool):
+    if not mmap:
+        return faiss.read_index(path)
+    try:
+        return faiss.read_index(path, MMAP_FLAGS)
+    except RuntimeError:
+        # Index types without mmap support are read into the heap instead.
+        return faiss.read_index(path, faiss.IO_FLAG_READ_ONLY)
+
+
+def load_current(mmap: bool = True) -> Optional[IndexSnapshot]:
+    """Load the generation the manifest points at, falling back to the legacy files."""
+    manifest = read_manifest()
+    if manifest is not None:
+        base = generation_path(manifest)
+        index_file = os.path.join(base, INDEX_FILENAME)
+        mapping_file = os.path.join(base, MAPPING_FILENAME)
+        generation = manifest["generation"]
+        meta = manifest.get("meta", {})
+    elif os.path.exists(LEGACY_INDEX_FILE) and os.path.exists(LEGACY_MAPPING_FILE):
+        # Positional pickled list from before generations existed.
+        index_file = LEGACY_INDEX_FILE
+        mapping_file = LEGACY_MAPPING_FILE
+        generation = 0
+        meta = {}
+    else:
+        return None
+
+    index = _read_index(index_file, mmap)
+    chunk_mapping = None
+    if os.path.exists(mapping_file):
+        # Generations published before the chunk store carry their own mapping.
+        with open(mapping_file, "rb") as f:
+            chunk_mapping = pickle.load(f)
+    return IndexSnapshot(generation, index, chunk_mapping, meta)
+
+
+def published_stats() -> Optional[dict]:
+    """Figures about the published generation, re-read only when the manifest changes."""
+    global _published_stats
+    mtime = manifest_mtime()
+    if mtime == _published_stats[0]:
+        return _published_stats[1]
+    manifest = read_manifest()
+    stats = None
+    if manifest is not None:
+        meta = manifest.get("meta", {})
+        try:
+            size = os.path.getsize(os.path.join(generation_path(manifest), INDEX_FILENAME))
+        except OSError:
+            size = None
+        stats = {
+            "generation": manifest["generation"],
+            "vectors": manifest.get("ntotal"),
+            "chunks": meta.get("total_chunks"),
+            "tombstones": len(meta.get("tombstones", [])),
+            "size_bytes": size,
+            "created_at": manifest.get("created_at"),
+        }
+    _published_stats = (mtime, stats)
+    return stats
+
+
+def _published(key: str):
+    return lambda: (published_stats() or {}).get(key)
+
+
+metrics.INDEX_GENERATION.set_function(_published("generation"))
+metrics.INDEX_VECTORS.set_function(_published("vectors"))
+metrics.INDEX_CHUNKS.set_function(_published("chunks"))
+metrics.INDEX_TOMBSTONES.set_function(_published("tombstones"))
+metrics.INDEX_SIZE_BYTES.set_function(_published("size_bytes"))
+metrics.INDEX_AGE_SECONDS.set_function(
+    lambda: time.time() - created if (created := _published("created_at")()) else None)
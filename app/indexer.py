@@ -1,208 +1,404 @@
 import os
-import faiss
-import pickle
+import fcntl
 import hashlib
+import numpy as np
+import pickle
 import threading
 import time
 from typing import Dict, Tuple
-from sentence_transformers import SentenceTransformer
-from docx import Document as DocxDocument
-import PyPDF2
+
+from app import ann, embedding, metrics, pipeline
+from app.changes import scan, start_event_source
+from app.chunk_store import SQLITE_PARAM_BATCH, ChunkStore
+from app.embed_cache import EmbeddingCache
+from app.generations import KEEP_GENERATIONS, load_current, next_generation, publish_generation
 
 DATA_DIR = os.getenv("DATA_PATH", "/data")
 INDEX_DIR = os.getenv("INDEX_PATH", "/index")
-EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
-CHUNK_SIZE = 500  # tokens or approx characters
+EMBEDDING_MODEL = embedding.EMBEDDING_MODEL
 POLL_INTERVAL = float(os.getenv("POLL_INTERVAL", "5"))
-
+# Compact (physically remove tombstoned vectors) once this share of the index is dead.
+COMPACT_RATIO = float(os.getenv("COMPACT_RATIO", "0.1"))
+COMPACT_MIN_TOMBSTONES = int(os.getenv("COMPACT_MIN_TOMBSTONES", "256"))
+EMBEDDING_CACHE = os.getenv("EMBEDDING_CACHE", "1") == "1"
+# Cached embeddings kept on disk (least recently used dropped first); 0 = unbounded.
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+# Host-local like ADMISSION_LOCK_DIR: flock is unreliable on network filesystems
+# such as the index volume. This elects one watcher among the workers of a host;
+# hosts sharing an index volume must not all run the watcher.
+INDEXER_LOCK_DIR = os.getenv("INDEXER_LOCK_DIR", "/tmp/rag-indexer")
+
+# Resident indexer state, kept between polls so an idle cycle touches no files.
+# Chunk text lives in the chunk store; chunk ids are the FAISS ids.
 index = None
-model = SentenceTransformer(EMBEDDING_MODEL)
-chunk_mapping_file = os.path.join(INDEX_DIR, "chunk_mapping.pkl")
+chunk_store = None
+indexed_files = None
+tombstones = set()
+next_chunk_id = 0
+index_kind = None
+trained_ntotal = 0
 indexed_files_file = os.path.join(INDEX_DIR, "indexed_files.pkl")
-
-def read_text_file(path: str) -> str:
-    with open(path, "r", encoding="utf-8", errors="ignore") as f:
-        return f.read()
-
-def read_docx_file(path: str) -> str:
-    doc = DocxDocument(path)
-    return "\n".join([p.text for p in doc.paragraphs if p.text.strip()])
-
-def read_pdf_file(path: str) -> str:
-    text = []
-    with open(path, "rb") as f:
-        reader = PyPDF2.PdfReader(f)
-        for page in reader.pages:
-            text.append(page.extract_text())
-    return "\n".join(filter(None, text))
-
-def chunk_text(text: str, size: int = CHUNK_SIZE):
-    """Split text into fixed-size chunks."""
-    return [text[i:i+size] for i in range(0, len(text), size)]
-
-#Hash method to get file hash
-def get_file_hash(path: str) -> str:
-    """Generate an md5 hash for the file contents."""
-    h = hashlib.md5()
-    with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):
-            h.update(chunk)
-    return h.hexdigest()
-
-
-def load_indexed_files() -> Dict[str, str]:
+# One lock per index, so several services on a host can index different volumes.
+lock_file = os.path.join(INDEXER_LOCK_DIR,
+                         hashlib.sha1(os.path.realpath(INDEX_DIR).encode()).hexdigest()[:16] + ".lock")
+embedding_cache_file = os.path.join(INDEX_DIR, "embedding_cache.sqlite")
+_embedding_cache = None
+# Next seq number per file while a pipeline run is adding its chunks.
+_file_seq = {}
+# monotonic() at the end of the watcher's last cycle, for the lag gauge.
+_last_cycle_at = None
+
+metrics.WATCHER_CYCLE_AGE_SECONDS.set_function(
+    lambda: time.monotonic() - _last_cycle_at if _last_cycle_at is not None else None)
+
+
+def get_chunk_store() -> ChunkStore:
+    global chunk_store
+    if chunk_store is None:
+        os.makedirs(INDEX_DIR, exist_ok=True)
+        chunk_store = ChunkStore()
+    return chunk_store
+
+
+def get_embedding_cache():
+    global _embedding_cache
+    if _embedding_cache is None and EMBEDDING_CACHE:
+        os.makedirs(INDEX_DIR, exist_ok=True)
+        # Keyed by backend too: ONNX / int8 vectors differ slightly from the reference ones.
+        _embedding_cache = EmbeddingCache(embedding_cache_file, embedding.model_id())
+    return _embedding_cache
+
+
+def encode_chunks(texts):
+    """Embed chunk texts, reusing cached vectors for text seen before."""
+    cache = get_embedding_cache()
+    if cache is None:
+        return embedding.encode(texts)
+    return cache.encode(texts, embedding.encode)
+
+def load_indexed_files() -> Dict[str, object]:
     if os.path.exists(indexed_files_file):
         with open(indexed_files_file, "rb") as f:
             return pickle.load(f)
     return {}
 
 
-def save_indexed_files(d: Dict[str, str]):
-    with open(indexed_files_file, "wb") as f:
+def save_indexed_files(d: Dict[str, object]):
+    tmp = indexed_files_file + ".tmp"
+    with open(tmp, "wb") as f:
         pickle.dump(d, f)
-
-def build_index():
-    global index
+    os.replace(tmp, indexed_files_file)
+
+
+def _reset_state():
+    """Start an empty index. Existing chunks are retired as of the next generation;
+    ids keep increasing so readers of the current generation are unaffected."""
+    global index, tombstones, next_chunk_id, index_kind, trained_ntotal
+    store = get_chunk_store()
+    store.delete_all(next_generation())
+    index = None
+    tombstones = set()
+    next_chunk_id = max(next_chunk_id, store.max_id() + 1)
+    index_kind = None
+    trained_ntotal = 0
+
+
+def _ensure_loaded():
+    """Load the published index and file manifest once; later polls reuse them."""
+    global index, indexed_files, tombstones, next_chunk_id, index_kind, trained_ntotal
+    if indexed_files is not None:
+        return
+    indexed_files = load_indexed_files()
+    store = get_chunk_store()
+    # The indexer mutates its copy, so read it into the heap rather than mmap.
+    snapshot = load_current(mmap=False)
+    if snapshot is None or isinstance(snapshot.chunk_mapping, list):
+        # Positional list mappings from older versions can no longer be trusted to
+        # line up with the vectors; re-embed everything once into an id-mapped index.
+        if snapshot is not None:
+            print("Migrating positional index to stable chunk ids; re-indexing all files")
+        _reset_state()
+        indexed_files = {}
+        return
+
+    if isinstance(snapshot.chunk_mapping, dict):
+        # Generation from before the chunk store: move its pickled mapping over once.
+        print(f"Importing {len(snapshot.chunk_mapping)} chunks into the chunk store")
+        store.import_mapping(snapshot.chunk_mapping)
+
+    index = snapshot.index
+    next_chunk_id = int(snapshot.meta.get("next_chunk_id", store.max_id() + 1))
+    tombstones = set(snapshot.meta.get("tombstones", []))
+    index_kind = snapshot.meta.get("index_kind", "flat")
+    trained_ntotal = int(snapshot.meta.get("trained_ntotal", 0))
+
+
+def _add_embedded(batch, emb):
+    """Pipeline sink: add a batch of (text, file) pairs under freshly assigned chunk ids."""
+    global index, next_chunk_id, index_kind
+    if index is None:
+        index, index_kind = ann.empty(emb.shape[1])
+    ids = np.arange(next_chunk_id, next_chunk_id + len(batch), dtype="int64")
+    index.add_with_ids(emb, ids)
+    rows = []
+    for cid, (txt, fn) in zip(ids.tolist(), batch):
+        seq = _file_seq.get(fn, 0)
+        _file_seq[fn] = seq + 1
+        rows.append((cid, fn, seq, txt))
+    get_chunk_store().add_chunks(rows)
+    next_chunk_id += len(batch)
+
+
+def _ingest(files) -> pipeline.PipelineStats:
+    """Extract, chunk, embed and add `files` (keys relative to DATA_DIR)."""
+    paths = [(fn, os.path.join(DATA_DIR, fn)) for fn in files]
+    cache = get_embedding_cache()
+    before = cache.stats() if cache is not None else None
+    _file_seq.clear()
+    stats = pipeline.run(paths, encode_chunks, _add_embedded)
+    if cache is not None:
+        after = cache.stats()
+        hits = after["hits"] - before["hits"]
+        misses = after["misses"] - before["misses"]
+        stats.extra["embedding_cache"] = {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            # Only new entries can push the cache over its bound.
+            "pruned": cache.prune(EMBEDDING_CACHE_MAX_ENTRIES) if misses else 0,
+        }
+    return stats
+
+
+def _settled_manifest(changes, attempted, stats: pipeline.PipelineStats) -> Dict[str, object]:
+    """`changes.manifest` without the `attempted` files the pipeline never finished.
+
+    Ingested files and files the readers rejected are settled; a file whose
+    extraction crashed a worker is left out so the next scan picks it up again.
+    """
+    settled = set(stats.ingested) | set(stats.failed)
+    attempted = set(attempted)
+    return {fn: st for fn, st in changes.manifest.items() if fn not in attempted or fn in settled}
+
+
+def _tombstone_file(fn: str, generation: int) -> int:
+    """Drop a file's chunks from the mapping; its vectors stay until compaction.
+
+    Readers only resolve chunks visible in their generation, so tombstoned vectors
+    are never served. `generation` is the one the cycle is about to publish.
+    """
+    ids = get_chunk_store().delete_file(fn, generation)
+    tombstones.update(ids)
+    return len(ids)
+
+
+def _rebuild():
+    """Rebuild (and retrain) the configured index type from the live vectors."""
+    global index, index_kind, trained_ntotal
+    store = get_chunk_store()
+    ids = np.array(store.live_ids(), dtype="int64")
+    vectors = ann.reconstruct(index, ids)
+    cache = get_embedding_cache()
+    if cache is not None:
+        # Prefer exact cached embeddings over vectors decoded from PQ / SQ codes.
+        # Sliced so only one batch of chunk text is in memory at a time.
+        for start in range(0, len(ids), SQLITE_PARAM_BATCH):
+            part = ids[start:start + SQLITE_PARAM_BATCH].tolist()
+            chunks = store.get_many(part)
+            exact = cache.lookup([chunks[cid].text for cid in part])
+            for row, v in enumerate(exact, start):
+                if v is not None:
+                    vectors[row] = v
+    before = index_kind
+    index, index_kind = ann.build(vectors, ids)
+    trained_ntotal = len(ids)
+    tombstones.clear()
+    print(f"Rebuilt index {before} -> {index_kind} ({ann.describe(index)}) over {len(ids)} vectors")
+
+
+def maybe_rebuild() -> bool:
+    """Train once enough vectors exist, and retrain after RETRAIN_GROWTH-fold growth."""
+    if index is None:
+        return False
+    if not ann.needs_rebuild(index_kind, trained_ntotal, get_chunk_store().count()):
+        return False
+    _rebuild()
+    return True
+
+
+def compact(force: bool = False) -> int:
+    """Remove tombstoned vectors from the index once enough have accumulated."""
+    if index is None or not tombstones:
+        return 0
+    if not force and len(tombstones) < max(COMPACT_MIN_TOMBSTONES, COMPACT_RATIO * index.ntotal):
+        return 0
+    if not ann.supports_remove(index):
+        removed = len(tombstones)
+        _rebuild()
+        return removed
+    removed = index.remove_ids(np.array(sorted(tombstones), dtype="int64"))
+    tombstones.clear()
+    print(f"Compacted index: removed {removed} tombstoned vectors, {index.ntotal} remain")
+    return removed
+
+
+def _publish():
+    store = get_chunk_store()
+    # Chunk rows must be durable before any generation can reference their ids.
+    store.commit()
+    generation = publish_generation(index, meta={
+        "next_chunk_id": next_chunk_id,
+        "tombstones": sorted(tombstones),
+        "index_kind": index_kind,
+        "trained_ntotal": trained_ntotal,
+        # Precomputed so queries never scan chunks for the policy markers.
+        "policy_chunk_id": store.policy_chunk_id(),
+        "total_chunks": store.count(),
+    })
+    store.purge(generation - KEEP_GENERATIONS)
+
+
+def build_index() -> Dict[str, object]:
+    """Re-index every file in DATA_DIR from scratch; returns the pipeline stats."""
+    global indexed_files
     os.makedirs(INDEX_DIR, exist_ok=True)
     # Rebuild the entire index from all files
-    index_file = os.path.join(INDEX_DIR, "faiss.index")
-
-    texts = []
-    chunk_mapping = []
-    indexed_files = {}
-
-    for fn in os.listdir(DATA_DIR):
-        path = os.path.join(DATA_DIR, fn)
-        if not os.path.isfile(path):
-            continue
-        ext = fn.lower().split('.')[-1]
-        try:
-            if ext == "txt":
-                content = read_text_file(path)
-            elif ext == "docx":
-                content = read_docx_file(path)
-            elif ext == "pdf":
-                content = read_pdf_file(path)
-            else:
-                continue
-            chunks = chunk_text(content)
-            texts.extend(chunks)
-            chunk_mapping.extend([{"file": fn, "text": c} for c in chunks])
-            indexed_files[fn] = get_file_hash(path)
-        except Exception as e:
-            print(f"Failed to read {path}: {e}")
-
-    if texts:
-        embeddings = model.encode(texts)
-        dim = embeddings.shape[1]
-        index = faiss.IndexFlatL2(dim)
-        index.add(embeddings)
-
-        faiss.write_index(index, index_file)
-        with open(chunk_mapping_file, "wb") as f:
-            pickle.dump(chunk_mapping, f)
+    changes = scan(DATA_DIR, {})
+    _reset_state()
+    stats = _ingest(changes.new)
+
+    if stats.chunks:
+        maybe_rebuild()
+        indexed_files = _settled_manifest(changes, changes.new, stats)
+        _publish()
         save_indexed_files(indexed_files)
+    else:
+        # Nothing to publish: undo the retirement of the old chunks and reload the
+        # published state on the next cycle, which then handles any deleted files.
+        get_chunk_store().rollback()
+        indexed_files = None
+
+    print(f"Indexed {stats.chunks} chunks from {stats.files} files: {stats.as_dict()}")
+    return stats.as_dict()
+
 
-    print(f"Indexed {len(texts)} chunks from {len(set([c['file'] for c in chunk_mapping]))} files")
+def _observe_cycle(stats: pipeline.PipelineStats, persist_seconds: float, changes):
+    for stage, seconds in (("extract", stats.extract_seconds), ("chunk", stats.chunk_seconds),
+                           ("embed", stats.embed_seconds), ("add", stats.add_seconds),
+                           ("persist", persist_seconds)):
+        metrics.INDEX_STAGE_SECONDS.labels(stage=stage).observe(seconds)
+    mtimes = [changes.manifest[fn].mtime_ns for fn in changes.new + changes.updated if fn in changes.manifest]
+    if mtimes:
+        metrics.INDEX_PUBLISH_LAG_SECONDS.observe(max(0.0, time.time() - max(mtimes) / 1e9))
 
 
-def index_new_files() -> Dict[str, int]:
+def index_new_files() -> Dict[str, object]:
     """Incrementally index new or modified files in DATA_DIR."""
-    global index
+    global indexed_files
     os.makedirs(INDEX_DIR, exist_ok=True)
-    index_file = os.path.join(INDEX_DIR, "faiss.index")
+    _ensure_loaded()
 
-    indexed_files = load_indexed_files()
-    chunk_mapping = []
-    if os.path.exists(index_file) and os.path.exists(chunk_mapping_file):
-        index = faiss.read_index(index_file)
-        with open(chunk_mapping_file, "rb") as f:
-            chunk_mapping = pickle.load(f)
-    else:
-        index = None
-
-    current_files = set()
-    new_files = []
-    updated_files = []
-
-    for fn in os.listdir(DATA_DIR):
-        path = os.path.join(DATA_DIR, fn)
-        if not os.path.isfile(path):
-            continue
-        ext = fn.lower().split('.')[-1]
-        if ext not in ("txt", "docx", "pdf"):
-            continue
-        current_files.add(fn)
-        h = get_file_hash(path)
-        if fn not in indexed_files:
-            new_files.append((fn, path, ext))
-        elif indexed_files.get(fn) != h:
-            updated_files.append((fn, path, ext))
-
-    # detect deleted files
-    deleted_files = set(indexed_files.keys()) - current_files
-    for dfn in deleted_files:
-        chunk_mapping = [c for c in chunk_mapping if c["file"] != dfn]
-        indexed_files.pop(dfn, None)
-
-    added_chunks = []
-    for fn, path, ext in new_files + updated_files:
-        try:
-            if ext == "txt":
-                content = read_text_file(path)
-            elif ext == "docx":
-                content = read_docx_file(path)
-            elif ext == "pdf":
-                content = read_pdf_file(path)
-            else:
-                continue
-            chunks = chunk_text(content)
-            if (fn, path, ext) in updated_files:
-                chunk_mapping = [c for c in chunk_mapping if c["file"] != fn]
-            added_chunks.extend([(c, fn) for c in chunks])
-            indexed_files[fn] = get_file_hash(path)
-        except Exception as e:
-            print(f"Failed to process {path}: {e}")
-
-    if added_chunks:
-        texts = [c for c, _ in added_chunks]
-        emb = model.encode(texts)
-        if index is None:
-            index = faiss.IndexFlatL2(emb.shape[1])
-        index.add(emb)
-        chunk_mapping.extend([{"file": fn, "text": txt} for txt, fn in added_chunks])
+    changes = scan(DATA_DIR, indexed_files)
+    metrics.INDEX_STAGE_SECONDS.labels(stage="scan").observe(changes.scan_seconds)
+    result = {
+        "new_files": len(changes.new),
+        "updated_files": len(changes.updated),
+        "deleted_files": len(changes.deleted),
+        "new_chunks": 0,
+        "removed_chunks": 0,
+        "compacted_vectors": 0,
+        "total_chunks": get_chunk_store().count(),
+        "hashed_files": changes.hashed,
+        "scan_seconds": round(changes.scan_seconds, 4),
+    }
 
+    if changes.is_empty():
+        # Idle cycles are when compaction and retraining run in the background.
+        result["compacted_vectors"] = compact()
+        if maybe_rebuild() or result["compacted_vectors"]:
+            _publish()
+        # Touched-but-identical files only refresh their stat entry; no index writes.
+        if changes.manifest != indexed_files:
+            indexed_files = changes.manifest
+            save_indexed_files(indexed_files)
+        return result
+
+    # deleted and updated files lose their old chunks. "New" files normally have
+    # none, but do after a crash between _publish() and save_indexed_files():
+    # the generation has their chunks while the saved manifest does not list them.
+    # Read once: the manifest carries the tombstone list, so re-parsing it per file adds up.
+    generation = next_generation()
+    for fn in changes.deleted + changes.updated + changes.new:
+        result["removed_chunks"] += _tombstone_file(fn, generation)
+
+    # Files that fail extraction stay in the manifest so they are not retried
+    # until they change again.
+    attempted = changes.new + changes.updated
+    stats = _ingest(attempted)
+    result["compacted_vectors"] = compact()
+    maybe_rebuild()
+
+    t = time.perf_counter()
     if index is not None:
-        faiss.write_index(index, index_file)
-        with open(chunk_mapping_file, "wb") as f:
-            pickle.dump(chunk_mapping, f)
+        _publish()
 
+    indexed_files = _settled_manifest(changes, attempted, stats)
     save_indexed_files(indexed_files)
-
-    result = {
-        "new_files": len(new_files),
-        "updated_files": len(updated_files),
-        "deleted_files": len(deleted_files),
-        "new_chunks": len(added_chunks),
-        "total_chunks": len(chunk_mapping),
-    }
-    print(f"Indexed {len(added_chunks)} new chunks ({len(new_files)} new files, {len(updated_files)} updated). Total chunks: {len(chunk_mapping)}")
+    _observe_cycle(stats, time.perf_counter() - t, changes)
+
+    result["new_chunks"] = stats.chunks
+    result["total_chunks"] = get_chunk_store().count()
+    result["pipeline"] = stats.as_dict()
+    print(f"Indexed {stats.chunks} new chunks ({len(changes.new)} new files, {len(changes.updated)} updated, "
+          f"{len(changes.deleted)} deleted) in scan {changes.scan_seconds:.3f}s. "
+          f"Total chunks: {result['total_chunks']}, tombstones: {len(tombstones)}. Pipeline: {stats.as_dict()}")
     return result
 
 
+def _acquire_indexer_lock():
+    """Only one process per host and index runs the watcher; returns the held lock file or None."""
+    os.makedirs(INDEXER_LOCK_DIR, exist_ok=True)
+    f = open(lock_file, "w")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        return None
+    return f
+
+
 def _watch_loop(poll_interval: float, stop_event: threading.Event):
-    """Background loop that polls DATA_DIR and calls index_new_files when changes are detected."""
-    # A simple approach: call index_new_files at startup, then poll
+    """Background loop that polls DATA_DIR and calls index_new_files when changes are detected.
+
+    Filesystem events (when watchdog is installed) wake the loop early; the poll
+    interval remains as the fallback.
+    """
+    global _last_cycle_at
+    lock = None
+    while lock is None and not stop_event.is_set():
+        # Another gunicorn worker already owns the index; take over if it exits.
+        lock = _acquire_indexer_lock()
+        if lock is None:
+            stop_event.wait(poll_interval)
+
+    wake = threading.Event()
+    observer = start_event_source(DATA_DIR, wake)
     try:
-        index_new_files()
-    except Exception:
-        pass
-    while not stop_event.is_set():
-        try:
-            index_new_files()
-        except Exception as e:
-            print(f"Watcher error: {e}")
-        stop_event.wait(poll_interval)
+        while not stop_event.is_set():
+            wake.clear()
+            try:
+                index_new_files()
+            except Exception as e:
+                print(f"Watcher error: {e}")
+            _last_cycle_at = time.monotonic()
+            if wake.wait(poll_interval):
+                # Let a burst of writes settle before scanning.
+                stop_event.wait(0.5)
+    finally:
+        if observer is not None:
+            observer.stop()
+        if lock is not None:
+            lock.close()
 
 
 def start_background_watcher(poll_interval: float = POLL_INTERVAL) -> Tuple[threading.Event, threading.Thread]:
@@ -1,13 +1,42 @@
 import os
-from fastapi import FastAPI
-from pydantic import BaseModel
-from app.query import query_llm
+import json
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
+from app import metrics
+from app.admission import Overloaded
+from app.profiling import ProfilingMiddleware
+from app.query import (admission_stats, answer_cache_stats, close_http_client, context_stats, generation_stats,
+                       query_llm, query_llm_batch, query_llm_stream, retrieval_stats, start_http_client)
+from app.embedding import start_warm_up
 from app.indexer import start_background_watcher
 
 app = FastAPI(title="RAG FAISS Service")
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(metrics.MetricsMiddleware, paths=["/query", "/query/stream", "/query/batch", "/stats", "/metrics"])
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "256"))
 
 class QueryRequest(BaseModel):
     question: str
+    # Optional per-request ANN search knobs (IVF / HNSW indexes only)
+    nprobe: Optional[int] = Field(None, gt=0)
+    ef_search: Optional[int] = Field(None, gt=0)
+    # Token budget for retrieved context (defaults to CONTEXT_TOKEN_BUDGET)
+    max_context_tokens: Optional[int] = Field(None, ge=0)
+    # Longest wait for a generation slot (capped at ADMISSION_QUEUE_TIMEOUT)
+    queue_timeout: Optional[float] = Field(None, gt=0)
+
+
+class BatchQueryRequest(BaseModel):
+    questions: List[str]
+    nprobe: Optional[int] = Field(None, gt=0)
+    ef_search: Optional[int] = Field(None, gt=0)
+    max_context_tokens: Optional[int] = Field(None, ge=0)
+    # Max concurrent generations for this batch (defaults to BATCH_CONCURRENCY)
+    concurrency: Optional[int] = None
+    # Stream NDJSON results as they complete instead of one ordered response
+    stream: bool = False
 
 
 @app.on_event("startup")
@@ -17,10 +46,14 @@ def _startup():
     stop_event, thread = start_background_watcher(poll_interval=poll)
     app.state._watch_stop_event = stop_event
     app.state._watch_thread = thread
+    # One pooled Ollama client per worker, reused by every request
+    start_http_client()
+    # Load the embedding model in the background instead of on the first request
+    start_warm_up()
 
 
 @app.on_event("shutdown")
-def _shutdown():
+async def _shutdown():
     # Stop background watcher
     stop_event = getattr(app.state, "_watch_stop_event", None)
     thread = getattr(app.state, "_watch_thread", None)
@@ -31,9 +64,93 @@ def _shutdown():
             thread.join(timeout=5)
         except Exception:
             pass
+    await close_http_client()
+
+
+@app.exception_handler(Overloaded)
+async def _overloaded(request: Request, exc: Overloaded):
+    return JSONResponse(status_code=exc.status_code, content={"detail": str(exc)},
+                        headers={"Retry-After": str(exc.retry_after)})
 
 
 @app.post("/query")
 async def query(req: QueryRequest):
-    answer = await query_llm(req.question)
+    answer = await query_llm(req.question, nprobe=req.nprobe, ef_search=req.ef_search,
+                             max_context_tokens=req.max_context_tokens, queue_timeout=req.queue_timeout)
     return {"answer": answer}
+
+
+@app.post("/query/stream")
+async def query_stream(req: QueryRequest):
+    """Stream the answer as NDJSON: {"token": ...} lines, then a final {"done": true, ...}."""
+    stream = query_llm_stream(req.question, nprobe=req.nprobe, ef_search=req.ef_search,
+                              max_context_tokens=req.max_context_tokens, queue_timeout=req.queue_timeout)
+    # Wait for the first event before sending headers, so a request shed by
+    # admission control still gets a real 429 / 503.
+    try:
+        first = await stream.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except Overloaded:
+        raise
+    except Exception as e:
+        first = {"error": str(e), "done": True}
+        await stream.aclose()
+
+    async def events():
+        if first is None:
+            return
+        yield json.dumps(first) + "\n"
+        if "error" in first:
+            return
+        try:
+            async for event in stream:
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            # Headers are already sent; report the failure in-band.
+            yield json.dumps({"error": str(e), "done": True}) + "\n"
+        finally:
+            # Frees the generation slot promptly if the client went away.
+            await stream.aclose()
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@app.post("/query/batch")
+async def query_batch(req: BatchQueryRequest):
+    if len(req.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+    results = query_llm_batch(req.questions, nprobe=req.nprobe, ef_search=req.ef_search,
+                              concurrency=req.concurrency, max_context_tokens=req.max_context_tokens)
+
+    if req.stream:
+        async def events():
+            try:
+                async for item in results:
+                    yield json.dumps(item) + "\n"
+            except Exception as e:
+                yield json.dumps({"error": str(e)}) + "\n"
+
+        return StreamingResponse(events(), media_type="application/x-ndjson")
+
+    ordered = [None] * len(req.questions)
+    async for item in results:
+        ordered[item.pop("index")] = item
+    return {"results": ordered}
+
+
+@app.get("/stats")
+async def stats():
+    return {
+        "retrieval_batches": retrieval_stats(),
+        "generation": generation_stats(),
+        "answer_cache": answer_cache_stats(),
+        "context": context_stats(),
+        "admission": admission_stats(),
+    }
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    # Per-worker registry; see app/metrics.py.
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,285 @@
+"""Minimal in-process metrics rendered in the Prometheus text format.
+
+Each gunicorn worker keeps its own registry, so scrape results describe the
+worker that served /metrics. Indexer timings only exist in the worker that
+holds the indexer lock; index gauges are read from the shared manifest and
+look the same from every worker.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Latency buckets (seconds) from sub-millisecond FAISS searches up to long generations.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_registry: List["_Metric"] = []
+_registry_lock = threading.Lock()
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                    for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _format_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[Tuple[str, str], ...], object] = {}
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+        return tuple((n, str(labels[n])) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = list(self._children.items())
+        for key, child in children:
+            lines.extend(self._render_child(key, child))
+        return lines
+
+    def _render_child(self, key, child) -> List[str]:
+        raise NotImplementedError
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count", "lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        if not self.labelnames:
+            self._children[()] = _HistogramChild(self.buckets)
+
+    def labels(self, **labels) -> _HistogramChild:
+        key = self._key(labels)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, _HistogramChild(self.buckets))
+        return child
+
+    def observe(self, value: float):
+        self._children[()].observe(value)
+
+    def time(self):
+        return self._children[()].time()
+
+    def _render_child(self, key, child) -> List[str]:
+        with child.lock:
+            counts, total, count = list(child.counts), child.sum, child.count
+        lines = []
+        cumulative = 0
+        for bound, n in zip(list(self.buckets) + [float("inf")], counts):
+            cumulative += n
+            lines.append(f"{self.name}_bucket{_format_labels(key, ('le', _format_value(bound)))} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class _ValueChild:
+    __slots__ = ("value", "fn")
+
+    def __init__(self):
+        self.value = 0.0
+        self.fn = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def set_function(self, fn: Callable[[], Optional[float]]):
+        """Compute the value at scrape time instead of on the hot path."""
+        self.fn = fn
+
+    def get(self) -> Optional[float]:
+        if self.fn is not None:
+            try:
+                return self.fn()
+            except Exception:
+                return None
+        return self.value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        if not self.labelnames:
+            self._children[()] = _ValueChild()
+
+    def labels(self, **labels) -> _ValueChild:
+        key = self._key(labels)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, _ValueChild())
+        return child
+
+    def set(self, value: float):
+        self._children[()].set(value)
+
+    def inc(self, amount: float = 1.0):
+        self._children[()].inc(amount)
+
+    def set_function(self, fn: Callable[[], Optional[float]]):
+        self._children[()].set_function(fn)
+
+    def _render_child(self, key, child) -> List[str]:
+        value = child.get()
+        if value is None:
+            return []
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}"]
+
+
+class Counter(Gauge):
+    kind = "counter"
+
+
+def median(rows: Sequence[dict], key: str) -> Optional[float]:
+    """Median of `key` over recent stats dicts, ignoring rows where it is missing."""
+    values = sorted(r[key] for r in rows if r.get(key) is not None)
+    return values[len(values) // 2] if values else None
+
+
+def render() -> str:
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for m in metrics:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# -- query path -----------------------------------------------------------------
+
+QUERY_STAGE_SECONDS = Histogram(
+    "rag_query_stage_seconds",
+    "Time spent per query stage (embed, search and fetch are per retrieval batch).",
+    ["stage"],
+)
+RETRIEVAL_BATCH_SIZE = Histogram(
+    "rag_retrieval_batch_size", "Questions per micro-batched retrieval call.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+OLLAMA_TTFT_SECONDS = Histogram("rag_ollama_ttft_seconds", "Time to first Ollama token.")
+OLLAMA_GENERATION_SECONDS = Histogram("rag_ollama_generation_seconds", "Total Ollama generation time.")
+OLLAMA_TOKENS_PER_SECOND = Histogram(
+    "rag_ollama_tokens_per_second", "Ollama decode throughput per generation.",
+    buckets=(1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 200),
+)
+PROMPT_TOKENS = Histogram(
+    "rag_prompt_tokens", "Estimated prompt tokens sent to Ollama.",
+    buckets=(64, 128, 256, 512, 768, 1024, 1536, 2048, 3072, 4096, 8192),
+)
+CONTEXT_PASSAGES = Histogram(
+    "rag_context_passages", "Passages in the assembled prompt context.", buckets=(0, 1, 2, 3, 4, 5, 8, 10, 20))
+ANSWER_CACHE_LOOKUPS = Counter("rag_answer_cache_lookups_total", "Answer cache lookups by result.", ["result"])
+ADMISSION_WAIT_SECONDS = Histogram(
+    "rag_admission_wait_seconds", "Time queued before a generation slot was granted.", ["priority"])
+ADMISSION_REJECTED = Counter("rag_admission_rejected_total", "Generations shed by admission control.", ["reason"])
+ADMISSION_ACTIVE = Gauge("rag_admission_active", "Generations holding a slot in this worker.")
+ADMISSION_QUEUED = Gauge("rag_admission_queued", "Generations waiting for a slot in this worker.")
+HTTP_REQUEST_SECONDS = Histogram("rag_http_request_seconds", "HTTP request latency.", ["method", "path", "status"])
+
+# -- indexer --------------------------------------------------------------------
+
+INDEX_STAGE_SECONDS = Histogram(
+    "rag_index_stage_seconds",
+    "Time per index_new_files() stage per cycle (extract/chunk are summed worker busy time).",
+    ["stage"],
+)
+INDEX_PUBLISH_LAG_SECONDS = Histogram(
+    "rag_index_publish_lag_seconds", "Newest changed file mtime to generation publish.")
+
+# -- index state (read from the shared manifest at scrape time) -----------------
+
+INDEX_GENERATION = Gauge("rag_index_generation", "Published index generation.")
+INDEX_LOADED_GENERATION = Gauge("rag_index_loaded_generation", "Index generation loaded by this worker.")
+INDEX_VECTORS = Gauge("rag_index_vectors", "Vectors in the published index, tombstones included.")
+INDEX_CHUNKS = Gauge("rag_index_chunks", "Live chunks in the published index.")
+INDEX_TOMBSTONES = Gauge("rag_index_tombstones", "Deleted chunks awaiting compaction.")
+INDEX_SIZE_BYTES = Gauge("rag_index_size_bytes", "Size of the published FAISS index file.")
+INDEX_AGE_SECONDS = Gauge("rag_index_age_seconds", "Seconds since the current generation was published.")
+WATCHER_CYCLE_AGE_SECONDS = Gauge(
+    "rag_watcher_last_cycle_age_seconds", "Seconds since this worker's watcher finished a cycle (indexer worker only).")
+
+
+class MetricsMiddleware:
+    """ASGI middleware observing request latency, including streamed bodies."""
+
+    def __init__(self, app, paths: Sequence[str] = ()):
+        self.app = app
+        # Unknown paths share one label so scanners cannot blow up cardinality.
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            path = scope["path"] if scope["path"] in self.paths else "other"
+            HTTP_REQUEST_SECONDS.labels(method=scope["method"], path=path, status=status).observe(
+                time.perf_counter() - start)
@@ -0,0 +1,209 @@
+"""Staged ingestion: extract (process pool) -> chunk -> batched embed -> index add.
+
+Stages are connected by bounded queues / a bounded number of in-flight
+extractions, so peak memory depends on the batch and queue sizes rather than on
+the size of the corpus.
+"""
+import os
+import queue
+import threading
+import time
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.documents import chunk_text, read_file
+
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+# spawn keeps torch / faiss thread state of the parent out of the workers.
+EXTRACT_START_METHOD = os.getenv("EXTRACT_START_METHOD", "spawn")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+CHUNK_QUEUE_SIZE = int(os.getenv("CHUNK_QUEUE_SIZE", "1024"))
+
+_DONE = object()
+
+
+def _extract(path: str) -> Tuple[str, float]:
+    t = time.perf_counter()
+    text = read_file(path)
+    return text, time.perf_counter() - t
+
+
+class _InlineFuture:
+    """Synchronous stand-in so small batches skip process-pool start-up."""
+
+    def __init__(self, fn, *args):
+        try:
+            self._result, self._error = fn(*args), None
+        except Exception as e:
+            self._result, self._error = None, e
+
+    def result(self):
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+class PipelineStats:
+    def __init__(self):
+        self.files = 0
+        self.failed_files = 0
+        # File keys whose chunks all reached the sink, files the readers rejected,
+        # and files whose extraction killed a worker process (retried next cycle).
+        self.ingested: List[str] = []
+        self.failed: List[str] = []
+        self.crashed: List[str] = []
+        self.chunks = 0
+        self.extract_seconds = 0.0
+        self.chunk_seconds = 0.0
+        self.embed_seconds = 0.0
+        self.add_seconds = 0.0
+        self.wall_seconds = 0.0
+        self.extra = {}
+
+    def as_dict(self) -> Dict[str, float]:
+        wall = self.wall_seconds or 1e-9
+        return {
+            "files": self.files,
+            "failed_files": self.failed_files,
+            "crashed_files": len(self.crashed),
+            "chunks": self.chunks,
+            "files_per_s": round(self.files / wall, 2),
+            "chunks_per_s": round(self.chunks / wall, 2),
+            # Busy time per stage; extraction is summed across worker processes.
+            "extract_seconds": round(self.extract_seconds, 3),
+            "chunk_seconds": round(self.chunk_seconds, 3),
+            "embed_seconds": round(self.embed_seconds, 3),
+            "add_seconds": round(self.add_seconds, 3),
+            "embed_chunks_per_s": round(self.chunks / self.embed_seconds, 2) if self.embed_seconds else 0.0,
+            "wall_seconds": round(self.wall_seconds, 3),
+            **self.extra,
+        }
+
+
+def _new_pool(workers: int) -> Optional[ProcessPoolExecutor]:
+    if workers <= 1:
+        return None
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context(EXTRACT_START_METHOD))
+
+
+def _submit(pool: Optional[ProcessPoolExecutor], path: str):
+    if pool is None:
+        return _InlineFuture(_extract, path)
+    try:
+        return pool.submit(_extract, path)
+    except BrokenProcessPool as e:
+        fut = Future()
+        fut.set_exception(e)
+        return fut
+
+
+def _produce(paths: Sequence[Tuple[str, str]], out: "queue.Queue", stats: PipelineStats,
+             stop: threading.Event):
+    """Extraction + chunking stage; puts (chunk_text, file) pairs on `out`.
+
+    A worker process that dies (e.g. OOM-killed on a large PDF) breaks the whole
+    pool, failing every extraction in flight. Those files are retried one at a
+    time in a fresh pool, so only the file that kills a worker again is given up on.
+    """
+    workers = min(EXTRACT_WORKERS, len(paths))
+    pool = _new_pool(workers)
+    max_inflight = max(1, workers * 2)
+    todo = deque(paths)
+    # In flight when a worker died; retried in isolation.
+    suspects = deque()
+    pending = deque()
+
+    try:
+        while not stop.is_set():
+            source = suspects if suspects else todo
+            limit = 1 if suspects else max_inflight
+            while len(pending) < limit and source:
+                fn, path = source.popleft()
+                pending.append((fn, path, _submit(pool, path), source is suspects))
+            if not pending:
+                break
+            fn, path, fut, isolated = pending.popleft()
+            try:
+                text, seconds = fut.result()
+            except BrokenProcessPool:
+                if isolated:
+                    stats.crashed.append(fn)
+                    print(f"Extraction worker died on {path}; will retry next cycle")
+                else:
+                    suspects.append((fn, path))
+                    suspects.extend((f, p) for f, p, _, _ in pending)
+                    pending.clear()
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = _new_pool(workers)
+                continue
+            except Exception as e:
+                stats.failed_files += 1
+                stats.failed.append(fn)
+                print(f"Failed to process {path}: {e}")
+                continue
+            stats.extract_seconds += seconds
+            t = time.perf_counter()
+            chunks = chunk_text(text)
+            stats.chunk_seconds += time.perf_counter() - t
+            stats.files += 1
+            for c in chunks:
+                out.put((c, fn))
+            stats.ingested.append(fn)
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+        out.put(_DONE)
+
+
+def run(paths: Sequence[Tuple[str, str]],
+        encode: Callable[[List[str]], object],
+        sink: Callable[[List[Tuple[str, str]], object], None]) -> PipelineStats:
+    """Stream `(file_key, path)` pairs through the pipeline.
+
+    `encode` embeds a list of chunk texts; `sink` receives each batch of
+    (chunk_text, file_key) pairs with its embeddings, e.g. to add them to the index.
+    When it returns, every file in `stats.ingested` has all its chunks in the sink.
+    """
+    stats = PipelineStats()
+    start = time.perf_counter()
+    chunks: "queue.Queue" = queue.Queue(maxsize=CHUNK_QUEUE_SIZE)
+    stop = threading.Event()
+    producer = threading.Thread(target=_produce, args=(list(paths), chunks, stats, stop), daemon=True)
+    producer.start()
+
+    def flush(batch):
+        t = time.perf_counter()
+        emb = encode([c for c, _ in batch])
+        stats.embed_seconds += time.perf_counter() - t
+        t = time.perf_counter()
+        sink(batch, emb)
+        stats.add_seconds += time.perf_counter() - t
+        stats.chunks += len(batch)
+
+    batch = []
+    try:
+        while True:
+            item = chunks.get()
+            if item is _DONE:
+                break
+            batch.append(item)
+            if len(batch) >= EMBED_BATCH_SIZE:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+    finally:
+        stop.set()
+        # Unblock a producer stuck on a full queue after an embedding error.
+        while producer.is_alive():
+            try:
+                chunks.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        producer.join()
+
+    stats.wall_seconds = time.perf_counter() - start
+    return stats
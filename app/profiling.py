@@ -0,0 +1,119 @@
+"""Opt-in sampling profiler for single requests.
+
+With PROFILING=1, a request carrying the `X-Profile: 1` header is sampled
+every PROFILE_INTERVAL_MS on the event-loop thread and the retrieval thread.
+Stacks are written in collapsed format (one `frame;frame;frame count` line per
+stack, readable by flamegraph.pl / speedscope) and the file name is returned in
+the `X-Profile-File` response header. Concurrent requests show up in the same
+samples, so profile on a quiet worker.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict
+
+PROFILING_ENABLED = os.getenv("PROFILING", "0") == "1"
+PROFILE_HEADER = b"x-profile"
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/rag-profiles")
+# Worker threads (by name prefix) sampled alongside the request's own thread.
+PROFILE_THREAD_PREFIXES = ("retrieval",)
+MAX_STACK_DEPTH = 128
+
+
+def _collapse(frame) -> str:
+    parts = []
+    while frame is not None and len(parts) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+class SamplingProfiler:
+    def __init__(self, thread_id: int, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000.0
+        self.samples: Counter = Counter()
+        self.ticks = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self.started = None
+        self.seconds = 0.0
+
+    def _targets(self) -> Dict[int, str]:
+        targets = {self.thread_id: "request"}
+        for t in threading.enumerate():
+            if t.ident is not None and t.name.startswith(PROFILE_THREAD_PREFIXES):
+                targets[t.ident] = t.name
+        return targets
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            self.ticks += 1
+            for ident, name in self._targets().items():
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.samples[f"{name};{_collapse(frame)}"] += 1
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.seconds = time.perf_counter() - self.started
+
+    def write(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _wants_profile(scope) -> bool:
+    for name, value in scope.get("headers", []):
+        if name == PROFILE_HEADER:
+            return value.strip() in (b"1", b"true", b"yes")
+    return False
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles a request until its body is fully sent."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not PROFILING_ENABLED or scope["type"] != "http" or not _wants_profile(scope):
+            return await self.app(scope, receive, send)
+
+        path = os.path.join(PROFILE_DIR, f"profile-{os.getpid()}-{time.time_ns()}.collapsed")
+        profiler = SamplingProfiler(threading.get_ident())
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-file", path.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop()
+            _save(profiler, path, scope["path"])
+
+
+def _save(profiler: SamplingProfiler, path: str, request_path: str):
+    try:
+        profiler.write(path)
+    except OSError as e:
+        print(f"Could not write profile {path}: {e}")
+        return
+    print(f"Profiled {request_path}: {profiler.ticks} ticks over {profiler.seconds:.3f}s -> {path}")
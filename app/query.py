@@ -1,59 +1,283 @@
 import os
-import pickle
-import faiss
+import json
+import time
+import asyncio
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, NamedTuple, Optional
+
 import httpx
-from sentence_transformers import SentenceTransformer
+
+from app import admission, ann, context, embedding, metrics
+from app.answer_cache import AnswerCache, normalize_question
+from app.batching import MicroBatcher
+from app.chunk_store import CHUNK_STORE_FILE, Chunk, ChunkStore, is_policy_chunk
+from app.generations import IndexSnapshot, load_current, manifest_mtime
 
 INDEX_DIR = os.getenv("INDEX_PATH", "/index")
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://ollama:11434")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "phi3:14b")
-TOP_K = 5
+# How often (seconds) a worker stats the manifest looking for a new generation.
+RELOAD_CHECK_INTERVAL = float(os.getenv("RELOAD_CHECK_INTERVAL", "1"))
+# Concurrent questions arriving within this window are embedded and searched together.
+QUERY_BATCH_SIZE = int(os.getenv("QUERY_BATCH_SIZE", "32"))
+QUERY_BATCH_WAIT_MS = float(os.getenv("QUERY_BATCH_WAIT_MS", "2"))
+# Read timeout applies between streamed chunks, so it bounds stalls, not total generation time.
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "120"))
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "32"))
+# Default number of concurrent generations for one /query/batch request.
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+# Answer cache per worker; size 0 disables it. Similarity > 0 (cosine) enables
+# near-duplicate matches on the question embedding.
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0"))
 
 # Lazy-loaded globals
-_index = None
-_chunk_mapping = None
-_embedder = None
+_snapshot = None
+_manifest_mtime = 0
+_last_reload_check = 0.0
+_retriever = None
+# One thread: encode + search never run on the event loop, and the next batch
+# fills up while the current one is being processed.
+_retrieval_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="retrieval")
+# New generations are loaded here, not on the event loop or behind retrieval batches.
+_reload_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-reload")
+_reload = None
+_http_client = None
+_generation_stats = deque(maxlen=1000)
+_context_stats = deque(maxlen=1000)
+_answer_cache = AnswerCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_SIMILARITY)
+# (generation, cache key) -> future of the answer being generated right now
+_inflight = {}
+_coalesced = 0
+_chunk_store = None
+_legacy_policy = (None, False)
+
+
+# Stage histograms; retrieve is the queue wait + batch as seen by one request.
+_STAGE_EMBED = metrics.QUERY_STAGE_SECONDS.labels(stage="embed")
+_STAGE_SEARCH = metrics.QUERY_STAGE_SECONDS.labels(stage="search")
+_STAGE_FETCH = metrics.QUERY_STAGE_SECONDS.labels(stage="fetch")
+_STAGE_RETRIEVE = metrics.QUERY_STAGE_SECONDS.labels(stage="retrieve")
+_STAGE_PROMPT = metrics.QUERY_STAGE_SECONDS.labels(stage="prompt")
+metrics.ANSWER_CACHE_LOOKUPS.labels(result="hit").set_function(lambda: _answer_cache.hits)
+metrics.ANSWER_CACHE_LOOKUPS.labels(result="similar_hit").set_function(lambda: _answer_cache.similar_hits)
+metrics.ANSWER_CACHE_LOOKUPS.labels(result="miss").set_function(lambda: _answer_cache.misses)
+metrics.ANSWER_CACHE_LOOKUPS.labels(result="coalesced").set_function(lambda: _coalesced)
+metrics.INDEX_LOADED_GENERATION.set_function(lambda: _snapshot.generation if _snapshot is not None else None)
+
+
+class Retrieved(NamedTuple):
+    distances: object
+    ids: object
+    embedding: object  # question embedding
+    chunks: Dict[int, Chunk]  # text of the hits, fetched only for these ids
+
+
+class PreparedQuery(NamedTuple):
+    answer: Optional[str]  # canned policy answer, if any
+    prompt: Optional[str]
+    embedding: Optional[object]  # question embedding, for near-duplicate caching
+    context: Optional[dict] = None  # context assembly stats, incl. prompt token estimate
+
+
+class GenerationStats:
+    """Time-to-first-token and throughput of one Ollama generation."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token_at = None
+        self.end = None
+        self.tokens = 0
+        self.eval_count = None
+        self.eval_duration_ns = None
+        self.prompt_eval_count = None
+
+    def token(self, text: str):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.tokens += 1
+
+    def finish(self, final: Optional[dict] = None):
+        if final:
+            self.eval_count = final.get("eval_count")
+            self.eval_duration_ns = final.get("eval_duration")
+            self.prompt_eval_count = final.get("prompt_eval_count")
+        if self.end is None:
+            self.end = time.perf_counter()
+
+    def as_dict(self) -> dict:
+        end = self.end or time.perf_counter()
+        ttft = (self.first_token_at - self.start) if self.first_token_at else None
+        tokens = self.eval_count or self.tokens
+        if self.eval_count and self.eval_duration_ns:
+            # Ollama's own decode rate excludes queueing and prompt evaluation.
+            tps = self.eval_count / (self.eval_duration_ns / 1e9)
+        elif ttft is not None and end > self.first_token_at:
+            tps = self.tokens / (end - self.first_token_at)
+        else:
+            tps = None
+        return {
+            "ttft_s": round(ttft, 4) if ttft is not None else None,
+            "total_s": round(end - self.start, 4),
+            "tokens": tokens,
+            "tokens_per_s": round(tps, 2) if tps is not None else None,
+            "prompt_tokens": self.prompt_eval_count,
+        }
+
+
+def _record_generation(stats: GenerationStats):
+    summary = stats.as_dict()
+    _generation_stats.append(summary)
+    if summary["ttft_s"] is not None:
+        metrics.OLLAMA_TTFT_SECONDS.observe(summary["ttft_s"])
+    metrics.OLLAMA_GENERATION_SECONDS.observe(summary["total_s"])
+    if summary["tokens_per_s"] is not None:
+        metrics.OLLAMA_TOKENS_PER_SECOND.observe(summary["tokens_per_s"])
+
+
+def generation_stats() -> dict:
+    """Summary of recent generations (median TTFT and tokens/s)."""
+    recent = list(_generation_stats)
+    return {
+        "count": len(recent),
+        "median_ttft_s": metrics.median(recent, "ttft_s"),
+        "median_total_s": metrics.median(recent, "total_s"),
+        "median_tokens_per_s": metrics.median(recent, "tokens_per_s"),
+        "median_prompt_tokens": metrics.median(recent, "prompt_tokens"),
+    }
 
 
-def load_index():
-    global _index, _chunk_mapping
+def context_stats() -> dict:
+    return context.context_summary(list(_context_stats))
 
-    if _index is not None and _chunk_mapping is not None:
-        return
 
-    index_file = os.path.join(INDEX_DIR, "faiss.index")
-    mapping_file = os.path.join(INDEX_DIR, "chunk_mapping.pkl")
+def start_http_client() -> httpx.AsyncClient:
+    """Create the long-lived, pooled Ollama client (called at app startup)."""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(OLLAMA_READ_TIMEOUT, connect=OLLAMA_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=OLLAMA_MAX_CONNECTIONS,
+                                max_keepalive_connections=OLLAMA_MAX_CONNECTIONS),
+        )
+    return _http_client
 
-    if not os.path.exists(index_file) or not os.path.exists(mapping_file):
-        raise RuntimeError("FAISS index not found. Call /index first.")
 
-    _index = faiss.read_index(index_file)
+def get_http_client() -> httpx.AsyncClient:
+    return start_http_client()
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def _load_snapshot() -> Optional[IndexSnapshot]:
+    """Open the published generation; blocking, so it runs on the reload thread."""
+    snapshot = load_current(mmap=True)
+    if snapshot is None:
+        return None
+    # Tombstoned (deleted, not yet compacted) vectors are filtered inside the search.
+    return snapshot._replace(exclude=ann.exclude_selector(snapshot.meta.get("tombstones", [])))
+
+
+def _finish_reload(mtime: float, fut: "asyncio.Future"):
+    global _snapshot, _manifest_mtime, _reload
+    _reload = None
+    if fut.cancelled():
+        return
+    error = fut.exception()
+    snapshot = fut.result() if error is None else None
+    if snapshot is None:
+        # Generation pruned or replaced between reading the manifest and opening it;
+        # the next check retries because _manifest_mtime is unchanged.
+        if _snapshot is not None:
+            print(f"Index reload failed, keeping generation {_snapshot.generation}: {error}")
+        return
+    if _snapshot is None or snapshot.generation != _snapshot.generation:
+        print(f"Loaded index generation {snapshot.generation} ({snapshot.index.ntotal} vectors)")
+    _snapshot = snapshot
+    _manifest_mtime = mtime
+
 
-    with open(mapping_file, "rb") as f:
-        _chunk_mapping = pickle.load(f)
+async def load_index() -> IndexSnapshot:
+    """Return the newest loaded index generation.
 
+    A new generation is loaded in the background while requests keep using the
+    current one; the snapshot is then swapped as a single reference, so requests
+    that already hold the previous one finish against it. Only the very first
+    load is awaited.
+    """
+    global _last_reload_check, _reload
+
+    now = time.monotonic()
+    if _snapshot is not None and now - _last_reload_check < RELOAD_CHECK_INTERVAL:
+        return _snapshot
+    _last_reload_check = now
+
+    mtime = manifest_mtime()
+    if _reload is None and (_snapshot is None or mtime != _manifest_mtime):
+        _reload = asyncio.get_running_loop().run_in_executor(_reload_executor, _load_snapshot)
+        _reload.add_done_callback(functools.partial(_finish_reload, mtime))
+    if _snapshot is not None:
+        return _snapshot
+
+    # Shielded: a cancelled request must not cancel the load other requests wait for.
+    snapshot = await asyncio.shield(_reload)
+    if snapshot is None:
+        raise RuntimeError("FAISS index not found. Call /index first.")
+    return snapshot
 
-def _find_policy_chunk() -> str:
-    """Search indexed chunks for the greetings/identity policy marker.
-    Return the chunk text if found, else empty string.
+
+def _find_policy_chunk(chunk_mapping) -> str:
+    """Search a pickled mapping (generations from before the chunk store) for the
+    greetings/identity policy marker. Return the chunk text if found, else empty string.
     """
-    if _chunk_mapping is None:
+    if chunk_mapping is None:
         return ""
-    markers = [
-        "SYSTEM IDENTITY AND GREETINGS POLICY",
-        "NBS Assistant",
-        "GREETINGS AND BASIC INTERACTIONS",
-        "IDENTITY",
-        "CAPABILITIES",
-    ]
-    for c in _chunk_mapping:
+    chunks = chunk_mapping.values() if isinstance(chunk_mapping, dict) else chunk_mapping
+    for c in chunks:
         txt = c.get("text", "")
-        up = txt.upper()
-        if any(m in up for m in markers):
+        if is_policy_chunk(txt):
             return txt
     return ""
 
 
+def _has_policy_chunk(snapshot: IndexSnapshot) -> bool:
+    """Whether the indexed documents include the policy file (precomputed at index time)."""
+    global _legacy_policy
+    if snapshot.chunk_mapping is None:
+        return snapshot.meta.get("policy_chunk_id") is not None
+    if _legacy_policy[0] is not snapshot:
+        _legacy_policy = (snapshot, bool(_find_policy_chunk(snapshot.chunk_mapping)))
+    return _legacy_policy[1]
+
+
+def get_chunk_store() -> Optional[ChunkStore]:
+    global _chunk_store
+    if _chunk_store is None and os.path.exists(CHUNK_STORE_FILE):
+        _chunk_store = ChunkStore(CHUNK_STORE_FILE, readonly=True)
+    return _chunk_store
+
+
+def _fetch_chunks(snapshot: IndexSnapshot, ids) -> Dict[int, Chunk]:
+    """Chunk rows for the given ids, as visible in the snapshot's generation."""
+    mapping = snapshot.chunk_mapping
+    if mapping is None:
+        store = get_chunk_store()
+        return store.get_many(ids, snapshot.generation) if store is not None else {}
+    # Legacy mappings numbered a file's chunks consecutively, so the id stands in for seq.
+    if isinstance(mapping, dict):
+        return {i: Chunk(i, mapping[i]["file"], i, mapping[i]["text"]) for i in ids if i in mapping}
+    return {i: Chunk(i, mapping[i]["file"], i, mapping[i]["text"]) for i in ids if 0 <= i < len(mapping)}
+
+
 def _is_greeting_intent(question: str) -> bool:
     q = question.strip().lower()
     greetings = {"hi", "hello", "hey", "hi!", "hello!", "hey!"}
@@ -78,45 +302,95 @@ def _is_capabilities_intent(question: str) -> bool:
 
 
 def load_embedder():
-    global _embedder
-    if _embedder is None:
-        _embedder = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-
-
-async def query_llm(question: str) -> str:
+    return embedding.get_model()
+
+
+def _retrieve_batch(items):
+    """Embed all questions in one call, then run one FAISS search per distinct
+    (snapshot, nprobe, efSearch) group over the stacked query matrix."""
+    metrics.RETRIEVAL_BATCH_SIZE.observe(len(items))
+    with _STAGE_EMBED.time():
+        q_embeddings = embedding.encode([question for _, question, _, _, _ in items])
+    groups = {}
+    for row, (snapshot, _, k, nprobe, ef_search) in enumerate(items):
+        groups.setdefault((id(snapshot), nprobe, ef_search), []).append(row)
+
+    results = [None] * len(items)
+    for (_, nprobe, ef_search), rows in groups.items():
+        snapshot = items[rows[0]][0]
+        k = max(items[r][2] for r in rows)
+        with _STAGE_SEARCH.time():
+            distances, indices = ann.search(snapshot.index, q_embeddings[rows], k,
+                                            nprobe=nprobe, ef_search=ef_search, sel=snapshot.exclude)
+        with _STAGE_FETCH.time():
+            chunks = _fetch_chunks(snapshot, sorted(set(indices.ravel().tolist())))
+        for i, r in enumerate(rows):
+            hits = {cid: chunks[cid] for cid in indices[i].tolist() if cid in chunks}
+            results[r] = Retrieved(distances[i], indices[i], q_embeddings[r], hits)
+    return results
+
+
+def get_retriever() -> MicroBatcher:
+    global _retriever
+    if _retriever is None:
+        _retriever = MicroBatcher(_retrieve_batch, QUERY_BATCH_SIZE, QUERY_BATCH_WAIT_MS, _retrieval_executor)
+    return _retriever
+
+
+async def retrieve(snapshot: IndexSnapshot, question: str, k: int,
+                   nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """Return the Retrieved hits for one question via the shared micro-batcher."""
+    return await get_retriever().submit((snapshot, question, k, nprobe, ef_search))
+
+
+def retrieval_stats():
+    return get_retriever().stats()
+
+
+async def retrieve_many(snapshot: IndexSnapshot, questions, nprobe: Optional[int] = None,
+                        ef_search: Optional[int] = None):
+    """Retrieve for many questions with one encode call and one batched FAISS search."""
+    k = context.candidate_k()
+    items = [(snapshot, q, k, nprobe, ef_search) for q in questions]
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_retrieval_executor, _retrieve_batch, items)
+
+
+async def build_prompt(question: str, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                       snapshot: Optional[IndexSnapshot] = None, retrieved=None,
+                       max_context_tokens: Optional[int] = None) -> PreparedQuery:
     """
     1️⃣ Embed question
-    2️⃣ Retrieve top-k chunks from FAISS
-    3️⃣ Build RAG prompt
-    4️⃣ Call Ollama
+    2️⃣ Retrieve candidate chunks from FAISS
+    3️⃣ Assemble context within the token budget (see app.context)
+    4️⃣ Build RAG prompt
+
+    Policy intents come back with `answer` set and no prompt. `retrieved` is a
+    precomputed Retrieved result, e.g. from retrieve_many().
     """
-    load_index()
-    load_embedder()
+    snapshot = snapshot or await load_index()
 
     # First: detect greeting/identity/capability intents and honor policy file if present
-    policy_chunk = _find_policy_chunk()
-    if policy_chunk:
+    if _has_policy_chunk(snapshot):
         if _is_greeting_intent(question):
-            return "Hello! How can I assist you today?"
+            return PreparedQuery("Hello! How can I assist you today?", None, None)
         if _is_identity_intent(question):
-            return "I am NBS Assistant, your helpful AI companion."
+            return PreparedQuery("I am NBS Assistant, your helpful AI companion.", None, None)
         if _is_capabilities_intent(question):
-            return ("I can answer questions based on available documents, explain concepts clearly, "
-                    "and assist with technical, professional, and general knowledge questions.")
-
-    # Embed question
-    q_embedding = _embedder.encode([question])
+            return PreparedQuery("I can answer questions based on available documents, explain concepts clearly, "
+                                 "and assist with technical, professional, and general knowledge questions.",
+                                 None, None)
 
-    # FAISS search
-    distances, indices = _index.search(q_embedding, TOP_K)
+    # Embed question + FAISS search, batched with concurrent requests off the event loop.
+    if retrieved is None:
+        with _STAGE_RETRIEVE.time():
+            retrieved = await retrieve(snapshot, question, context.candidate_k(), nprobe=nprobe, ef_search=ef_search)
+    started = time.perf_counter()
+    distances, indices, q_embedding, chunks = retrieved
 
-    context_chunks = [
-        _chunk_mapping[i]["text"]
-        for i in indices[0]
-        if i < len(_chunk_mapping)
-    ]
-
-    context_text = "\n\n".join(context_chunks)
+    assembled = context.assemble(distances, indices, chunks, index=snapshot.index,
+                                 max_tokens=max_context_tokens)
+    context_text = assembled.text
 
     prompt = f"""
 You are a helpful assistant.
@@ -130,19 +404,215 @@ Question:
 
 Answer:
 """.strip()
+    _STAGE_PROMPT.observe(time.perf_counter() - started)
+    stats = {**assembled.stats, "prompt_tokens_estimate": context.estimate_tokens(prompt)}
+    _context_stats.append(stats)
+    metrics.PROMPT_TOKENS.observe(stats["prompt_tokens_estimate"])
+    metrics.CONTEXT_PASSAGES.observe(stats["used"])
+    return PreparedQuery(None, prompt, q_embedding, stats)
+
 
+async def generate_stream(prompt: str, stats: Optional[GenerationStats] = None) -> AsyncIterator[str]:
+    """4️⃣ Call Ollama, yielding response tokens as they arrive."""
+    stats = stats if stats is not None else GenerationStats()
     payload = {
         "model": OLLAMA_MODEL,
         "prompt": prompt,
-        "stream": False
+        "stream": True
     }
 
-    async with httpx.AsyncClient(timeout=5000) as client:
-        response = await client.post(
-            f"{OLLAMA_BASE_URL}/api/generate",
-            json=payload
-        )
+    client = get_http_client()
+    async with client.stream("POST", f"{OLLAMA_BASE_URL}/api/generate", json=payload) as response:
         response.raise_for_status()
-        data = response.json()
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            data = json.loads(line)
+            if "error" in data:
+                raise RuntimeError(f"Ollama error: {data['error']}")
+            token = data.get("response", "")
+            if token:
+                stats.token(token)
+                yield token
+            if data.get("done"):
+                stats.finish(data)
+                break
+    stats.finish()
+    _record_generation(stats)
+
+
+def _begin_flight(flight_key) -> "asyncio.Future":
+    fut = asyncio.get_running_loop().create_future()
+    # Nobody may be waiting on it; retrieve the exception so asyncio does not warn.
+    fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+    _inflight[flight_key] = fut
+    return fut
+
+
+def _end_flight(flight_key, fut, answer: Optional[str] = None, error: Optional[BaseException] = None):
+    _inflight.pop(flight_key, None)
+    if fut.done():
+        return
+    if error is None:
+        fut.set_result(answer)
+    elif isinstance(error, Exception):
+        fut.set_exception(error)
+    else:
+        # Leader cancelled or its stream closed by the client; waiters get a plain error.
+        fut.set_exception(RuntimeError("Generation was aborted"))
+
+
+async def _join_flight(question: str, nprobe: Optional[int], ef_search: Optional[int],
+                       max_context_tokens: Optional[int], snapshot: Optional[IndexSnapshot] = None):
+    """Return (snapshot, cache params, flight key, answer-or-awaitable).
+
+    The last item is a cached answer (str), the future of an identical question
+    already being generated, or None when the caller must generate it.
+    """
+    global _coalesced
+    snapshot = snapshot or await load_index()
+    params = (nprobe, ef_search, max_context_tokens)
+    key = (normalize_question(question), params)
+    flight_key = (snapshot.generation, key)
+    cached = _answer_cache.get(snapshot.generation, key)
+    if cached is not None:
+        return snapshot, params, flight_key, cached
+    fut = _inflight.get(flight_key)
+    if fut is not None:
+        _coalesced += 1
+        return snapshot, params, flight_key, fut
+    return snapshot, params, flight_key, None
+
+
+def answer_cache_stats() -> dict:
+    return {**_answer_cache.stats(), "coalesced": _coalesced, "inflight": len(_inflight)}
+
 
-    return data.get("response", "")
+def admission_stats() -> dict:
+    return admission.get_controller().stats()
+
+
+def _admit(prepared: PreparedQuery, batch: bool = False, queue_timeout: Optional[float] = None):
+    """Generation slot from admission control; short prompts are admitted first."""
+    tokens = (prepared.context or {}).get("prompt_tokens_estimate")
+    return admission.get_controller().slot(admission.priority_for(tokens, batch), queue_timeout)
+
+
+async def query_llm(question: str, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                    snapshot: Optional[IndexSnapshot] = None, retrieved=None,
+                    max_context_tokens: Optional[int] = None, batch: bool = False,
+                    queue_timeout: Optional[float] = None) -> str:
+    """Answer a question with RAG; the full completion is returned at once.
+
+    Answers are cached per index generation, and identical questions arriving
+    while one is being generated wait for that single generation. Generations
+    go through admission control and may raise admission.Overloaded.
+    """
+    snapshot, params, flight_key, found = await _join_flight(question, nprobe, ef_search, max_context_tokens,
+                                                             snapshot)
+    if isinstance(found, str):
+        return found
+    if found is not None:
+        return await asyncio.shield(found)
+
+    fut = _begin_flight(flight_key)
+    try:
+        prepared = await build_prompt(question, nprobe=nprobe, ef_search=ef_search,
+                                      snapshot=snapshot, retrieved=retrieved,
+                                      max_context_tokens=max_context_tokens)
+        answer = prepared.answer
+        if answer is None:
+            answer = _answer_cache.get_similar(snapshot.generation, params, prepared.embedding)
+        if answer is None:
+            _answer_cache.miss()
+            async with _admit(prepared, batch, queue_timeout):
+                parts = [token async for token in generate_stream(prepared.prompt)]
+            answer = "".join(parts)
+            _answer_cache.put(snapshot.generation, flight_key[1], params, answer, prepared.embedding)
+    except BaseException as e:
+        _end_flight(flight_key, fut, error=e)
+        raise
+    _end_flight(flight_key, fut, answer)
+    return answer
+
+
+async def query_llm_stream(question: str, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                           max_context_tokens: Optional[int] = None,
+                           queue_timeout: Optional[float] = None) -> AsyncIterator[dict]:
+    """Answer a question, yielding {"token": ...} events and a final {"done": True, ...}.
+
+    Cached and coalesced answers arrive as a single token.
+    """
+    snapshot, params, flight_key, found = await _join_flight(question, nprobe, ef_search, max_context_tokens)
+    if isinstance(found, str):
+        yield {"token": found}
+        yield {"done": True, "cached": True}
+        return
+    if found is not None:
+        yield {"token": await asyncio.shield(found)}
+        yield {"done": True, "coalesced": True}
+        return
+
+    fut = _begin_flight(flight_key)
+    try:
+        prepared = await build_prompt(question, nprobe=nprobe, ef_search=ef_search, snapshot=snapshot,
+                                      max_context_tokens=max_context_tokens)
+        answer = prepared.answer
+        cached = False
+        if answer is None:
+            answer = _answer_cache.get_similar(snapshot.generation, params, prepared.embedding)
+            cached = answer is not None
+        if answer is not None:
+            yield {"token": answer}
+            yield {"done": True, "cached": cached}
+        else:
+            _answer_cache.miss()
+            stats = GenerationStats()
+            parts = []
+            async with _admit(prepared, queue_timeout=queue_timeout):
+                async for token in generate_stream(prepared.prompt, stats):
+                    parts.append(token)
+                    yield {"token": token}
+            answer = "".join(parts)
+            _answer_cache.put(snapshot.generation, flight_key[1], params, answer, prepared.embedding)
+            yield {"done": True, **stats.as_dict(), "context": prepared.context}
+    except BaseException as e:
+        _end_flight(flight_key, fut, error=e)
+        raise
+    _end_flight(flight_key, fut, answer)
+
+
+async def query_llm_batch(questions, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                          concurrency: Optional[int] = None,
+                          max_context_tokens: Optional[int] = None) -> AsyncIterator[dict]:
+    """Answer many questions, yielding {"index", "answer"} or {"index", "error"} as each completes.
+
+    Retrieval for the whole batch is one encode call and one FAISS search; at
+    most `concurrency` generations run at a time. A failing item does not fail
+    the batch.
+    """
+    if not questions:
+        return
+    snapshot = await load_index()
+    retrieved = await retrieve_many(snapshot, questions, nprobe=nprobe, ef_search=ef_search)
+    semaphore = asyncio.Semaphore(max(1, concurrency or BATCH_CONCURRENCY))
+
+    async def answer_one(i: int) -> dict:
+        async with semaphore:
+            try:
+                answer = await query_llm(questions[i], nprobe=nprobe, ef_search=ef_search,
+                                         snapshot=snapshot, retrieved=retrieved[i],
+                                         max_context_tokens=max_context_tokens, batch=True)
+                return {"index": i, "answer": answer}
+            except admission.Overloaded as e:
+                return {"index": i, "error": str(e), "retry_after": e.retry_after}
+            except Exception as e:
+                return {"index": i, "error": str(e) or type(e).__name__}
+
+    tasks = [asyncio.ensure_future(answer_one(i)) for i in range(len(questions))]
+    try:
+        for done in asyncio.as_completed(tasks):
+            yield await done
+    finally:
+        for t in tasks:
+            t.cancel()
@@ -0,0 +1,114 @@
+"""Recall / latency / size comparison of the ANN index types in app.ann.
+
+Ground truth is an exact IndexFlatL2 over the same vectors. Examples:
+
+    python -m benchmarks.ann_benchmark --synthetic 200000
+    INDEX_PATH=/index python -m benchmarks.ann_benchmark --from-index --nprobe 8,16,32
+"""
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from app import ann
+from app.chunk_store import ChunkStore
+from app.generations import load_current
+from benchmarks.common import percentile_ms
+
+
+def synthetic_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    """Clustered, L2-normalised vectors, roughly shaped like sentence embeddings."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 500), dim)).astype("float32")
+    x = centers[rng.integers(0, len(centers), n)] + 0.3 * rng.standard_normal((n, dim)).astype("float32")
+    faiss.normalize_L2(x)
+    return x
+
+
+def index_vectors():
+    snapshot = load_current(mmap=False)
+    if snapshot is None:
+        raise SystemExit("No published index found under INDEX_PATH")
+    ids = np.array(ChunkStore().live_ids(), dtype="int64")
+    return ann.reconstruct(snapshot.index, ids)
+
+
+def run_config(index_type, vectors, queries, truth, k, nprobe=None, ef_search=None):
+    ids = np.arange(len(vectors), dtype="int64")
+    t0 = time.perf_counter()
+    index, kind = ann.build(vectors, ids, index_type)
+    build_s = time.perf_counter() - t0
+
+    latencies = []
+    found = np.empty((len(queries), k), dtype="int64")
+    for i in range(len(queries)):
+        t = time.perf_counter()
+        _, labels = ann.search(index, queries[i:i + 1], k, nprobe=nprobe, ef_search=ef_search)
+        latencies.append(time.perf_counter() - t)
+        found[i] = labels[0]
+
+    recall = np.mean([len(set(found[i]) & set(truth[i])) / k for i in range(len(queries))])
+    return {
+        "index_type": index_type,
+        "effective_type": kind,
+        "nprobe": nprobe if kind.startswith("ivf") else None,
+        "ef_search": ef_search if kind == "hnsw" else None,
+        "n": len(vectors),
+        "k": k,
+        f"recall@{k}": round(float(recall), 4),
+        "p50_ms": percentile_ms(latencies, 50),
+        "p99_ms": percentile_ms(latencies, 99),
+        "index_bytes": int(faiss.serialize_index(index).size),
+        "build_seconds": round(build_s, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--synthetic", type=int, metavar="N", help="benchmark N synthetic vectors")
+    source.add_argument("--from-index", action="store_true", help="use the vectors of the published index")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--types", default=",".join(ann.INDEX_TYPES))
+    parser.add_argument("--nprobe", default=str(ann.NPROBE), help="comma-separated sweep for IVF types")
+    parser.add_argument("--ef-search", default=str(ann.EF_SEARCH), help="comma-separated sweep for HNSW")
+    parser.add_argument("--threads", type=int, default=1, help="faiss OpenMP threads (1 = per-request view)")
+    parser.add_argument("--json", metavar="PATH", help="also write results to PATH")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    vectors = synthetic_vectors(args.synthetic, args.dim) if args.synthetic else index_vectors()
+    rng = np.random.default_rng(1)
+    # Queries are perturbed corpus vectors: near, but not identical to, stored points.
+    queries = vectors[rng.integers(0, len(vectors), args.queries)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype("float32")
+    queries = np.ascontiguousarray(queries, dtype="float32")
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+
+    results = []
+    for index_type in args.types.split(","):
+        if index_type.startswith("ivf"):
+            sweep = [dict(nprobe=int(v)) for v in args.nprobe.split(",")]
+        elif index_type == "hnsw":
+            sweep = [dict(ef_search=int(v)) for v in args.ef_search.split(",")]
+        else:
+            sweep = [{}]
+        for params in sweep:
+            r = run_config(index_type, vectors, queries, truth, args.k, **params)
+            results.append(r)
+            print(json.dumps(r))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
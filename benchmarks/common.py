@@ -0,0 +1,68 @@
+"""Helpers shared by the benchmark scripts: latency summaries, peak RSS and a
+results envelope that makes runs comparable between commits."""
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+
+def percentile_ms(samples: Sequence[float], q: float) -> Optional[float]:
+    if not len(samples):
+        return None
+    return round(float(np.percentile(samples, q)) * 1000, 3)
+
+
+def latency_summary(samples: Sequence[float]) -> Dict[str, Optional[float]]:
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(np.mean(samples)) * 1000, 3) if len(samples) else None,
+        "p50_ms": percentile_ms(samples, 50),
+        "p95_ms": percentile_ms(samples, 95),
+        "p99_ms": percentile_ms(samples, 99),
+        "max_ms": round(float(np.max(samples)) * 1000, 3) if len(samples) else None,
+    }
+
+
+def peak_rss_mb() -> Dict[str, float]:
+    """Peak resident set size of this process and of its waited-for children."""
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {"self_mb": round(own / scale, 1), "children_mb": round(children / scale, 1)}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def envelope(benchmark: str, config: dict, results) -> dict:
+    return {
+        "benchmark": benchmark,
+        "git_commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "host": {"python": platform.python_version(), "machine": platform.machine(),
+                 "cpus": os.cpu_count()},
+        "config": config,
+        "results": results,
+    }
+
+
+def emit(report: dict, path: Optional[str] = None):
+    """Print the report as JSON and optionally write it to `path`."""
+    text = json.dumps(report, indent=2)
+    print(text)
+    if path:
+        with open(path, "w") as f:
+            f.write(text + "\n")
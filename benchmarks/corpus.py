@@ -0,0 +1,195 @@
+"""Synthetic txt / docx / pdf corpus generator.
+
+Documents are paragraphs of seeded pseudo-English, so the same arguments always
+produce byte-identical text. A questions.jsonl file ({"question": ...} per line)
+built from the generated sentences is written next to the corpus for the load test.
+
+    python -m benchmarks.corpus --out /tmp/bench/data --files 500 --words 2000 --mix txt=6,docx=2,pdf=2
+"""
+import argparse
+import json
+import os
+import random
+from typing import Dict, List
+
+SYLLABLES = ["ka", "lo", "mi", "ren", "to", "sa", "vel", "dor", "an", "is", "pre", "qua", "tion", "ment",
+             "ber", "cal", "fin", "gor", "hel", "jun", "nor", "pol", "sti", "ver", "wen", "zor"]
+TOPICS = ["policy", "invoice", "deployment", "account", "network", "pricing", "contract", "security",
+          "backup", "schedule", "report", "customer", "warranty", "training", "budget", "license"]
+QUESTION_TEMPLATES = ["What does the documentation say about {}?", "How is {} handled?",
+                      "Summarize the section on {}.", "Who is responsible for {}?", "When is {} reviewed?"]
+
+
+def make_vocabulary(rng: random.Random, size: int = 5000) -> List[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3))))
+    return sorted(words)
+
+
+def make_paragraphs(rng: random.Random, vocab: List[str], n_words: int) -> List[str]:
+    paragraphs, sentence, paragraph, count = [], [], [], 0
+    while count < n_words:
+        word = rng.choice(TOPICS) if rng.random() < 0.05 else rng.choice(vocab)
+        sentence.append(word)
+        count += 1
+        if len(sentence) >= rng.randint(8, 20):
+            paragraph.append(" ".join(sentence).capitalize() + ".")
+            sentence = []
+            if len(paragraph) >= rng.randint(3, 7):
+                paragraphs.append(" ".join(paragraph))
+                paragraph = []
+    if sentence:
+        paragraph.append(" ".join(sentence).capitalize() + ".")
+    if paragraph:
+        paragraphs.append(" ".join(paragraph))
+    return paragraphs
+
+
+def write_txt(path: str, paragraphs: List[str]):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(paragraphs))
+
+
+def write_docx(path: str, paragraphs: List[str]):
+    from docx import Document
+
+    doc = Document()
+    for p in paragraphs:
+        doc.add_paragraph(p)
+    doc.save(path)
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _wrap(paragraphs: List[str], width: int = 90) -> List[str]:
+    lines = []
+    for p in paragraphs:
+        line = ""
+        for word in p.split():
+            if line and len(line) + 1 + len(word) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        lines.extend([line, ""])
+    return lines
+
+
+def write_pdf(path: str, paragraphs: List[str], lines_per_page: int = 60):
+    """Minimal text-only PDF (Helvetica, one content stream per page); no extra dependency."""
+    lines = _wrap(paragraphs)
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+    # Object numbers: 1 catalog, 2 pages, 3 font, then (page, content) pairs.
+    objects: Dict[int, bytes] = {}
+    kids = []
+    for i, page_lines in enumerate(pages):
+        page_no, content_no = 4 + 2 * i, 5 + 2 * i
+        kids.append(f"{page_no} 0 R")
+        ops = ["BT", "/F1 10 Tf", "12 TL", "50 780 Td"]
+        for line in page_lines:
+            ops.append(f"({_pdf_escape(line)}) Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1", "replace")
+        objects[content_no] = b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+        objects[page_no] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_no} 0 R >>").encode()
+    objects[1] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(pages)} >>".encode()
+    objects[3] = b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for num in sorted(objects):
+        offsets[num] = len(out)
+        out += b"%d 0 obj\n" % num + objects[num] + b"\nendobj\n"
+    xref = len(out)
+    size = max(objects) + 1
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % size
+    for num in range(1, size):
+        out += b"%010d 00000 n \n" % offsets[num]
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref)
+    with open(path, "wb") as f:
+        f.write(bytes(out))
+
+
+WRITERS = {"txt": write_txt, "docx": write_docx, "pdf": write_pdf}
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        ext, _, weight = part.partition("=")
+        if ext not in WRITERS:
+            raise ValueError(f"Unknown file type {ext!r}; expected one of {sorted(WRITERS)}")
+        weights[ext] = float(weight or 1)
+    return weights
+
+
+def generate(out_dir: str, files: int, words: int, mix: str = "txt=1", seed: int = 0,
+             questions: int = 200, subdirs: int = 0) -> dict:
+    """Write the corpus and questions.jsonl; returns a summary of what was written."""
+    rng = random.Random(seed)
+    vocab = make_vocabulary(rng)
+    weights = parse_mix(mix)
+    exts, cum = list(weights), []
+    total = 0.0
+    for ext in exts:
+        total += weights[ext]
+        cum.append(total)
+
+    os.makedirs(out_dir, exist_ok=True)
+    counts = {ext: 0 for ext in exts}
+    sentences = []
+    total_bytes = 0
+    for i in range(files):
+        r = rng.random() * total
+        ext = exts[next((j for j, c in enumerate(cum) if r < c), len(exts) - 1)]
+        paragraphs = make_paragraphs(rng, vocab, words)
+        folder = os.path.join(out_dir, f"d{i % subdirs}") if subdirs else out_dir
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"doc{i:06d}.{ext}")
+        WRITERS[ext](path, paragraphs)
+        total_bytes += os.path.getsize(path)
+        counts[ext] += 1
+        if len(sentences) < questions * 4:
+            sentences.extend(s.strip() for s in paragraphs[0].split(".") if len(s.split()) > 5)
+
+    questions_path = None
+    if questions:
+        questions_path = os.path.join(os.path.dirname(os.path.abspath(out_dir)), "questions.jsonl")
+        write_questions(questions_path, rng, sentences, questions)
+
+    return {"out": out_dir, "files": files, "words_per_file": words, "types": counts,
+            "bytes": total_bytes, "questions": questions_path, "seed": seed}
+
+
+def write_questions(path: str, rng: random.Random, sentences: List[str], n: int):
+    with open(path, "w") as f:
+        for i in range(n):
+            if sentences and i % 2:
+                # Paraphrase-like questions that should retrieve a specific chunk.
+                words = rng.choice(sentences).split()[:8]
+                q = f"What is said about {' '.join(words).lower()}?"
+            else:
+                q = rng.choice(QUESTION_TEMPLATES).format(rng.choice(TOPICS))
+            f.write(json.dumps({"question": q}) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True, help="directory to write documents into")
+    parser.add_argument("--files", type=int, default=100)
+    parser.add_argument("--words", type=int, default=1500, help="words per document")
+    parser.add_argument("--mix", default="txt=6,docx=2,pdf=2", help="relative weights per file type")
+    parser.add_argument("--subdirs", type=int, default=0, help="spread files over this many subdirectories")
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(generate(args.out, args.files, args.words, args.mix, args.seed, args.questions, args.subdirs)))
+
+
+if __name__ == "__main__":
+    main()
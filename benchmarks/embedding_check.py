@@ -0,0 +1,144 @@
+"""Throughput and agreement of the embedding backends against the reference model.
+
+Every candidate backend (see app.embedding) encodes the same chunks as the
+full-precision PyTorch reference. The check reports load time, batch
+throughput, single-text latency, per-text cosine similarity to the reference
+vectors, and nearest-neighbour agreement (recall@k of the candidate's top-k
+against the reference's). It exits non-zero when a backend falls below the
+thresholds, so it can gate switching EMBEDDING_BACKEND.
+
+    python -m benchmarks.embedding_check --backends onnx,int8 --threads 4 --json embed.json
+    python -m benchmarks.embedding_check --data /data --texts 2000
+"""
+import argparse
+import random
+import sys
+import time
+
+import numpy as np
+
+from app import embedding
+from app.changes import iter_documents
+from app.documents import chunk_text, read_file
+from benchmarks import corpus
+from benchmarks.common import emit, envelope, latency_summary
+
+
+def synthetic_texts(n: int, seed: int) -> list:
+    rng = random.Random(seed)
+    vocab = corpus.make_vocabulary(rng)
+    texts = []
+    while len(texts) < n:
+        texts.extend(chunk_text("\n\n".join(corpus.make_paragraphs(rng, vocab, 2000))))
+    return texts[:n]
+
+
+def data_texts(data_dir: str, n: int) -> list:
+    texts = []
+    # Same file selection as the indexer; unreadable documents are skipped like there.
+    for path in iter_documents(data_dir):
+        try:
+            texts.extend(chunk_text(read_file(path)))
+        except Exception as e:
+            print(f"Skipping {path}: {e}", file=sys.stderr)
+            continue
+        if len(texts) >= n:
+            break
+    return texts[:n]
+
+
+def _unit(x: np.ndarray) -> np.ndarray:
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+
+def measure(backend: str, texts: list, queries: list, batch_size: int, threads: int) -> dict:
+    t = time.perf_counter()
+    model = embedding.load_model(backend, threads=threads)
+    load_s = time.perf_counter() - t
+    embedding.encode(texts[:batch_size], model)  # warm-up
+
+    t = time.perf_counter()
+    vectors = np.concatenate([embedding.encode(texts[i:i + batch_size], model)
+                              for i in range(0, len(texts), batch_size)])
+    batch_s = time.perf_counter() - t
+
+    single = []
+    for q in queries:
+        t = time.perf_counter()
+        embedding.encode([q], model)
+        single.append(time.perf_counter() - t)
+    return {
+        "backend": backend,
+        "model_id": embedding.model_id(backend),
+        "load_seconds": round(load_s, 3),
+        "texts_per_s": round(len(texts) / batch_s, 1),
+        "single_text": latency_summary(single),
+        "_vectors": vectors,
+        "_queries": embedding.encode(queries, model),
+    }
+
+
+def agreement(ref: dict, cand: dict, k: int) -> dict:
+    cos = np.sum(_unit(ref["_vectors"]) * _unit(cand["_vectors"]), axis=1)
+    ref_docs, cand_docs = _unit(ref["_vectors"]), _unit(cand["_vectors"])
+    ref_top = np.argsort(-(_unit(ref["_queries"]) @ ref_docs.T), axis=1)[:, :k]
+    cand_top = np.argsort(-(_unit(cand["_queries"]) @ cand_docs.T), axis=1)[:, :k]
+    recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(ref_top, cand_top)])
+    return {
+        "cosine_mean": round(float(cos.mean()), 5),
+        "cosine_min": round(float(cos.min()), 5),
+        "cosine_p1": round(float(np.percentile(cos, 1)), 5),
+        f"neighbour_recall@{k}": round(float(recall), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="onnx,int8", help="candidates compared against torch")
+    parser.add_argument("--data", help="take chunks from this document directory instead of synthetic text")
+    parser.add_argument("--texts", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=100, help="texts also timed one at a time")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=embedding.EMBEDDING_THREADS)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="required mean cosine to the reference")
+    parser.add_argument("--min-recall", type=float, default=0.9, help="required neighbour recall@k")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", metavar="PATH", help="also write results to PATH")
+    args = parser.parse_args()
+
+    texts = data_texts(args.data, args.texts) if args.data else synthetic_texts(args.texts, args.seed)
+    if not texts:
+        raise SystemExit("No texts to embed")
+    # Queries are short prefixes of chunks, closer to real questions than whole chunks.
+    rng = random.Random(args.seed + 1)
+    queries = [" ".join(rng.choice(texts).split()[:12]) for _ in range(args.queries)]
+
+    reference = measure("torch", texts, queries, args.batch_size, args.threads)
+    results = [reference]
+    failed = []
+    for backend in [b for b in args.backends.split(",") if b and b != "torch"]:
+        try:
+            r = measure(backend, texts, queries, args.batch_size, args.threads)
+        except Exception as e:
+            results.append({"backend": backend, "error": str(e)})
+            failed.append(backend)
+            continue
+        r.update(agreement(reference, r, args.k))
+        r["speedup"] = round(r["texts_per_s"] / reference["texts_per_s"], 2)
+        r["ok"] = r["cosine_mean"] >= args.min_cosine and r[f"neighbour_recall@{args.k}"] >= args.min_recall
+        if not r["ok"]:
+            failed.append(backend)
+        results.append(r)
+
+    for r in results:
+        r.pop("_vectors", None)
+        r.pop("_queries", None)
+    config = {k: v for k, v in vars(args).items() if k != "json"}
+    config.update({"model": embedding.EMBEDDING_MODEL, "texts": len(texts)})
+    emit(envelope("embedding", config, results), args.json)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Indexing throughput and peak RSS for build_index() and index_new_files().
+
+Phases, each against the same fresh INDEX_PATH:
+  full         build_index() over the whole corpus
+  incremental  index_new_files() after modifying --modify files and adding --add new ones
+  idle         index_new_files() with nothing changed (scan cost only)
+
+    python -m benchmarks.index_benchmark --files 500 --words 2000 --json index.json
+    python -m benchmarks.index_benchmark --data /path/to/docs --workdir /tmp/bench
+
+Peak RSS is the process high-water mark after each phase (children = extraction
+workers), so later phases never report less than earlier ones.
+
+--data is copied into the workdir first: the incremental phase edits and adds
+files, and must not touch a real corpus.
+"""
+import argparse
+import glob
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks import corpus
+from benchmarks.common import emit, envelope, peak_rss_mb
+
+
+def _current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20, 1)
+    except (OSError, ValueError):
+        return 0.0
+
+
+def _phase(name: str, fn) -> dict:
+    t = time.perf_counter()
+    detail = fn()
+    wall = time.perf_counter() - t
+    return {"phase": name, "wall_seconds": round(wall, 3), "rss_mb": _current_rss_mb(),
+            "peak_rss": peak_rss_mb(), "detail": detail}
+
+
+def _modify(data_dir: str, n: int, seed: int):
+    files = sorted(p for p in glob.glob(os.path.join(data_dir, "**", "*.txt"), recursive=True))[:n]
+    for p in files:
+        with open(p, "a", encoding="utf-8") as f:
+            f.write(f"\n\nAmendment {seed}: this paragraph was appended by the benchmark.")
+    return len(files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workdir", help="scratch directory (default: a temp dir, removed afterwards)")
+    parser.add_argument("--data", help="index a copy of this directory instead of a synthetic corpus")
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--words", type=int, default=1500)
+    parser.add_argument("--mix", default="txt=6,docx=2,pdf=2")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--modify", type=int, default=10, help="txt files to change before the incremental phase")
+    parser.add_argument("--add", type=int, default=10, help="new files before the incremental phase")
+    parser.add_argument("--json", metavar="PATH", help="also write results to PATH")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rag-bench-")
+    index_dir = os.path.join(workdir, "index")
+    shutil.rmtree(index_dir, ignore_errors=True)
+    os.makedirs(index_dir)
+    data_dir = os.path.join(workdir, "data")
+    shutil.rmtree(data_dir, ignore_errors=True)
+    generated = None
+    if args.data:
+        shutil.copytree(args.data, data_dir)
+    else:
+        generated = corpus.generate(data_dir, args.files, args.words, args.mix, args.seed, questions=0)
+
+    # app modules read their paths at import time.
+    os.environ["DATA_PATH"] = data_dir
+    os.environ["INDEX_PATH"] = index_dir
+    from app import embedding, indexer
+
+    config = {k: v for k, v in vars(args).items() if k != "json"}
+    config.update({
+        "embedding_model": embedding.model_id(),
+        "embedding_threads": embedding.EMBEDDING_THREADS,
+        "index_type": os.getenv("INDEX_TYPE", "flat"),
+        "chunk_mode": os.getenv("CHUNK_MODE", "fixed"),
+        "extract_workers": indexer.pipeline.EXTRACT_WORKERS,
+        "embed_batch_size": indexer.pipeline.EMBED_BATCH_SIZE,
+        "corpus": generated,
+    })
+
+    t = time.perf_counter()
+    embedding.get_model()
+    model_load = round(time.perf_counter() - t, 3)
+
+    results = [_phase("full", indexer.build_index)]
+
+    def incremental():
+        modified = _modify(data_dir, args.modify, args.seed)
+        if args.add:
+            corpus.generate(os.path.join(data_dir, f"added-{args.seed}"), args.add, args.words, args.mix,
+                            args.seed + 1, questions=0)
+        out = indexer.index_new_files()
+        out["modified_files"] = modified
+        return out
+
+    results.append(_phase("incremental", incremental))
+    results.append(_phase("idle", indexer.index_new_files))
+
+    try:
+        emit(envelope("index", config, {"model_load_seconds": model_load, "phases": results}), args.json)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""Open-loop load test of the FastAPI app with a local Ollama stand-in.
+
+Questions are replayed from a JSONL file at a fixed (or Poisson) arrival rate,
+independent of how fast responses come back. Lines may carry "question", or
+"title" / "body" like requests.jsonl. By default the script does everything
+offline: it generates a corpus, starts the Ollama stub, starts the app under
+uvicorn, waits until the watcher has indexed the corpus and then runs the test.
+
+    python -m benchmarks.load_test --rate 10 --duration 30 --endpoint stream --json load.json
+    python -m benchmarks.load_test --url http://localhost:8083 --questions requests.jsonl --rate 2
+
+The answer cache is disabled in the spawned app unless --answer-cache is given,
+so repeated questions still exercise retrieval and generation.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import List, Optional
+
+import httpx
+
+from benchmarks import corpus, ollama_stub
+from benchmarks.common import emit, envelope, latency_summary
+
+ENDPOINTS = {"query": "/query", "stream": "/query/stream"}
+
+
+def load_questions(path: str) -> List[str]:
+    questions = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            q = item.get("question") or item.get("title") or item.get("body")
+            if q:
+                questions.append(q)
+    if not questions:
+        raise SystemExit(f"No questions found in {path}")
+    return questions
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Result:
+    __slots__ = ("ok", "latency", "ttft", "status", "error", "lag")
+
+    def __init__(self):
+        self.ok = False
+        self.latency = None
+        self.ttft = None
+        self.status = None
+        self.error = None
+        self.lag = 0.0
+
+
+async def _one(client: httpx.AsyncClient, endpoint: str, question: str, result: Result):
+    start = time.perf_counter()
+    try:
+        if endpoint == "stream":
+            async with client.stream("POST", ENDPOINTS[endpoint], json={"question": question}) as r:
+                result.status = r.status_code
+                async for line in r.aiter_lines():
+                    if not line:
+                        continue
+                    if result.ttft is None:
+                        result.ttft = time.perf_counter() - start
+                    event = json.loads(line)
+                    if "error" in event:
+                        result.error = "in-band error"
+                result.ok = r.status_code == 200 and result.error is None
+        else:
+            r = await client.post(ENDPOINTS[endpoint], json={"question": question})
+            result.status = r.status_code
+            result.ok = r.status_code == 200
+    except httpx.HTTPError as e:
+        result.error = type(e).__name__
+    result.latency = time.perf_counter() - start
+
+
+async def run_load(url: str, questions: List[str], rate: float, duration: float, endpoint: str,
+                   poisson: bool = False, timeout: float = 300.0, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    total = max(1, int(rate * duration))
+    results = [Result() for _ in range(total)]
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=256)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        tasks = []
+        start = time.perf_counter()
+        due = 0.0
+        for i in range(total):
+            delay = start + due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            results[i].lag = max(0.0, -delay)
+            tasks.append(asyncio.ensure_future(_one(client, endpoint, questions[i % len(questions)], results[i])))
+            due += rng.expovariate(rate) if poisson else 1.0 / rate
+        send_seconds = time.perf_counter() - start
+        await asyncio.gather(*tasks)
+        wall = time.perf_counter() - start
+        try:
+            server_stats = (await client.get("/stats")).json()
+        except (httpx.HTTPError, ValueError):
+            server_stats = None
+
+    ok = [r for r in results if r.ok]
+    failures = Counter(r.error or f"HTTP {r.status}" for r in results if not r.ok)
+    return {
+        "requests": total,
+        "succeeded": len(ok),
+        "failed": total - len(ok),
+        "failures": dict(failures),
+        "target_rps": rate,
+        "offered_rps": round(total / send_seconds, 2) if send_seconds else None,
+        "throughput_rps": round(len(ok) / wall, 2),
+        "wall_seconds": round(wall, 3),
+        "latency": latency_summary([r.latency for r in ok]),
+        "ttft": latency_summary([r.ttft for r in ok if r.ttft is not None]) if endpoint == "stream" else None,
+        # How late the client issued requests; large values mean the client, not the server, saturated.
+        "send_lag": latency_summary([r.lag for r in results]),
+        "server_stats": server_stats,
+    }
+
+
+def _wait_ready(url: str, proc: Optional[subprocess.Popen], timeout: float, warmup_question: str):
+    """Wait until the app answers a real query, i.e. the watcher has published an index."""
+    deadline = time.monotonic() + timeout
+    last = None
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise SystemExit(f"App exited with code {proc.returncode} during start-up")
+        try:
+            r = httpx.post(f"{url}/query", json={"question": warmup_question}, timeout=60)
+            if r.status_code == 200:
+                return
+            last = f"HTTP {r.status_code}: {r.text[:200]}"
+        except httpx.HTTPError as e:
+            last = type(e).__name__
+        time.sleep(1)
+    raise SystemExit(f"App at {url} not ready after {timeout:.0f}s (last: {last})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="target an already running service instead of spawning one")
+    parser.add_argument("--questions", help="JSONL question stream (default: generated with the corpus)")
+    parser.add_argument("--endpoint", choices=sorted(ENDPOINTS), default="query")
+    parser.add_argument("--rate", type=float, default=5.0, help="target requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of traffic to send")
+    parser.add_argument("--poisson", action="store_true", help="exponential inter-arrival times")
+    parser.add_argument("--timeout", type=float, default=300.0, help="per-request timeout")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", metavar="PATH", help="also write results to PATH")
+    spawn = parser.add_argument_group("spawned app (ignored with --url)")
+    spawn.add_argument("--workdir", help="scratch directory (default: a temp dir, removed afterwards)")
+    spawn.add_argument("--data", help="serve this document directory instead of a synthetic corpus")
+    spawn.add_argument("--files", type=int, default=100)
+    spawn.add_argument("--words", type=int, default=1500)
+    spawn.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    spawn.add_argument("--answer-cache", action="store_true", help="keep the answer cache enabled")
+    spawn.add_argument("--ready-timeout", type=float, default=600.0)
+    stub = parser.add_argument_group("Ollama stub (ignored with --url or --ollama-url)")
+    stub.add_argument("--ollama-url", help="use this Ollama instead of the stub")
+    stub.add_argument("--ttft-ms", type=float, default=100.0)
+    stub.add_argument("--token-ms", type=float, default=20.0)
+    stub.add_argument("--tokens", type=int, default=64)
+    stub.add_argument("--jitter", type=float, default=0.1)
+    args = parser.parse_args()
+
+    config = {k: v for k, v in vars(args).items() if k != "json"}
+    proc = server = None
+    workdir = None
+    url = args.url
+    questions_file = args.questions
+    try:
+        if url is None:
+            workdir = args.workdir or tempfile.mkdtemp(prefix="rag-load-")
+            data_dir = args.data or os.path.join(workdir, "data")
+            index_dir = os.path.join(workdir, "index")
+            shutil.rmtree(index_dir, ignore_errors=True)
+            os.makedirs(index_dir)
+            if not args.data:
+                shutil.rmtree(data_dir, ignore_errors=True)
+                generated = corpus.generate(data_dir, args.files, args.words, seed=args.seed)
+                questions_file = questions_file or generated["questions"]
+            ollama_url = args.ollama_url
+            if ollama_url is None:
+                server = ollama_stub.start(config=ollama_stub.StubConfig(
+                    args.ttft_ms, args.token_ms, args.tokens, args.jitter))
+                ollama_url = f"http://127.0.0.1:{server.server_port}"
+            port = _free_port()
+            env = dict(os.environ, DATA_PATH=data_dir, INDEX_PATH=index_dir, OLLAMA_BASE_URL=ollama_url,
+                       POLL_INTERVAL=os.getenv("POLL_INTERVAL", "1"))
+            if not args.answer_cache:
+                env["ANSWER_CACHE_SIZE"] = "0"
+            proc = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+                 "--workers", str(args.workers), "--log-level", "warning"],
+                env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            url = f"http://127.0.0.1:{port}"
+        if questions_file is None:
+            raise SystemExit("--questions is required with --url or --data")
+        questions = load_questions(questions_file)
+        t = time.perf_counter()
+        _wait_ready(url, proc, args.ready_timeout, questions[0])
+        ready_seconds = round(time.perf_counter() - t, 3)
+
+        results = asyncio.run(run_load(url, questions, args.rate, args.duration, args.endpoint,
+                                       args.poisson, args.timeout, args.seed))
+        results["ready_seconds"] = ready_seconds
+        if server is not None:
+            results["ollama_stub_requests"] = server.RequestHandlerClass.config.requests
+        emit(envelope("load", config, results), args.json)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if server is not None:
+            server.shutdown()
+        if workdir is not None and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Stand-in for the Ollama HTTP API so load tests run offline on a CPU-only box.
+
+Implements POST /api/generate (streaming NDJSON or a single JSON object),
+GET /api/tags and GET /api/version. The first token arrives after --ttft-ms,
+and each further token after --token-ms. Both can be jittered.
+
+    python -m benchmarks.ollama_stub --port 11435 --ttft-ms 150 --token-ms 20 --tokens 64
+    OLLAMA_BASE_URL=http://127.0.0.1:11435 uvicorn app.main:app
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+class StubConfig:
+    def __init__(self, ttft_ms: float = 100.0, token_ms: float = 20.0, tokens: int = 64,
+                 jitter: float = 0.0, model: str = "stub"):
+        self.ttft_ms = ttft_ms
+        self.token_ms = token_ms
+        self.tokens = tokens
+        self.jitter = jitter
+        self.model = model
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def delay(self, ms: float) -> float:
+        if self.jitter:
+            ms *= max(0.0, random.uniform(1 - self.jitter, 1 + self.jitter))
+        return ms / 1000.0
+
+    def count(self):
+        with self._lock:
+            self.requests += 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config: StubConfig = None
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _json(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._json(200, {"models": [{"name": self.config.model}]})
+        elif self.path == "/api/version":
+            self._json(200, {"version": "stub"})
+        else:
+            self._json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self._json(404, {"error": "not found"})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._json(400, {"error": "invalid JSON"})
+            return
+        cfg = self.config
+        cfg.count()
+        model = payload.get("model", cfg.model)
+        prompt_words = len(str(payload.get("prompt", "")).split())
+        start = time.perf_counter()
+
+        def final(eval_start: float) -> dict:
+            now = time.perf_counter()
+            return {"model": model, "response": "", "done": True, "done_reason": "stop",
+                    "prompt_eval_count": prompt_words, "eval_count": cfg.tokens,
+                    "eval_duration": int((now - eval_start) * 1e9), "total_duration": int((now - start) * 1e9)}
+
+        if not payload.get("stream", True):
+            time.sleep(cfg.delay(cfg.ttft_ms) + sum(cfg.delay(cfg.token_ms) for _ in range(cfg.tokens - 1)))
+            body = final(start)
+            body["response"] = " ".join(f"tok{i}" for i in range(cfg.tokens))
+            self._json(200, body)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(obj: dict):
+            data = (json.dumps(obj) + "\n").encode()
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        try:
+            time.sleep(cfg.delay(cfg.ttft_ms))
+            eval_start = time.perf_counter()
+            for i in range(cfg.tokens):
+                if i:
+                    time.sleep(cfg.delay(cfg.token_ms))
+                chunk({"model": model, "response": f"tok{i} ", "done": False})
+            chunk(final(eval_start))
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Client went away mid-stream (e.g. a cancelled request).
+            pass
+
+
+def start(host: str = "127.0.0.1", port: int = 0, config: Optional[StubConfig] = None) -> ThreadingHTTPServer:
+    """Serve in a daemon thread; returns the server (use server.server_port, server.shutdown())."""
+    handler = type("StubHandler", (_Handler,), {"config": config or StubConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="ollama-stub", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--ttft-ms", type=float, default=100.0, help="delay before the first token")
+    parser.add_argument("--token-ms", type=float, default=20.0, help="delay between tokens")
+    parser.add_argument("--tokens", type=int, default=64, help="tokens per answer")
+    parser.add_argument("--jitter", type=float, default=0.0, help="relative +/- jitter on every delay")
+    args = parser.parse_args()
+    server = start(args.host, args.port, StubConfig(args.ttft_ms, args.token_ms, args.tokens, args.jitter))
+    print(f"Ollama stub listening on http://{args.host}:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
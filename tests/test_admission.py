@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from app.admission import PRIORITY_BATCH, PRIORITY_NORMAL, PRIORITY_SHORT, AdmissionController, Overloaded
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_queue_full_is_rejected_with_429():
+    async def scenario():
+        ctl = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=5)
+        held = await ctl._acquire(PRIORITY_NORMAL, None)
+        waiter = asyncio.ensure_future(ctl._acquire(PRIORITY_NORMAL, None))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as exc:
+            await ctl._acquire(PRIORITY_NORMAL, None)
+        assert exc.value.status_code == 429
+        assert exc.value.retry_after >= 1
+        assert ctl.rejected_full == 1
+        ctl._release(held, 0.1)
+        ctl._release(await waiter, 0.1)
+        assert ctl.active == 0
+
+    _run(scenario())
+
+
+def test_queue_timeout_is_rejected_with_503():
+    async def scenario():
+        ctl = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=5)
+        held = await ctl._acquire(PRIORITY_NORMAL, None)
+        with pytest.raises(Overloaded) as exc:
+            await ctl._acquire(PRIORITY_NORMAL, 0.01)
+        assert exc.value.status_code == 503
+        assert ctl.timed_out == 1
+        assert ctl.queued == 0
+        ctl._release(held, 0.1)
+        assert ctl.active == 0
+
+    _run(scenario())
+
+
+def test_slot_granted_at_the_deadline_is_handed_back(monkeypatch):
+    async def grant_then_time_out(fut, timeout):
+        # The deadline fires in the same loop tick the slot is granted.
+        await fut
+        raise asyncio.TimeoutError
+
+    async def scenario():
+        ctl = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=5)
+        held = await ctl._acquire(PRIORITY_NORMAL, None)
+        waiter = asyncio.ensure_future(ctl._acquire(PRIORITY_NORMAL, 0.05))
+        await asyncio.sleep(0)
+        ctl._release(held, 0.1)
+        assert ctl.active == 1
+        with pytest.raises(Overloaded) as exc:
+            await waiter
+        assert exc.value.status_code == 503
+        assert ctl.active == 0
+        assert ctl.queued == 0
+        # The slot is free for the next request.
+        ctl._release(await ctl._acquire(PRIORITY_NORMAL, None), 0.1)
+
+    monkeypatch.setattr(asyncio, "wait_for", grant_then_time_out)
+    _run(scenario())
+
+
+def test_waiters_are_admitted_in_priority_order():
+    async def scenario():
+        ctl = AdmissionController(max_concurrent=1, max_queue=8, queue_timeout=5)
+        held = await ctl._acquire(PRIORITY_NORMAL, None)
+        order = []
+
+        async def request(name, priority):
+            token = await ctl._acquire(priority, None)
+            order.append(name)
+            ctl._release(token, 0.01)
+
+        tasks = [asyncio.ensure_future(request(name, priority)) for name, priority in (
+            ("batch", PRIORITY_BATCH), ("normal-1", PRIORITY_NORMAL), ("short", PRIORITY_SHORT),
+            ("normal-2", PRIORITY_NORMAL))]
+        await asyncio.sleep(0)
+        assert ctl.queued == 4
+        ctl._release(held, 0.01)
+        await asyncio.gather(*tasks)
+        assert order == ["short", "normal-1", "normal-2", "batch"]
+        assert ctl.active == 0
+
+    _run(scenario())
+
+
+def test_slot_context_releases_on_error():
+    async def scenario():
+        ctl = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=5)
+        with pytest.raises(ValueError):
+            async with ctl.slot(PRIORITY_SHORT):
+                assert ctl.active == 1
+                raise ValueError("generation failed")
+        assert ctl.active == 0
+        assert ctl.admitted == 1
+
+    _run(scenario())
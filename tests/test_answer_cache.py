@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from app import answer_cache
+from app.answer_cache import AnswerCache, normalize_question
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_normalize_question():
+    assert normalize_question("  What is  RAG?? ") == normalize_question("what is rag")
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = AnswerCache(10, ttl_s=60)
+    cache.put(1, "q", "p", "answer")
+    clock[0] += 59
+    assert cache.get(1, "q") == "answer"
+    clock[0] += 2
+    assert cache.get(1, "q") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = AnswerCache(2, ttl_s=60)
+    cache.put(1, "a", "p", "A")
+    cache.put(1, "b", "p", "B")
+    assert cache.get(1, "a") == "A"  # b is now the least recently used
+    cache.put(1, "c", "p", "C")
+    assert cache.get(1, "b") is None
+    assert cache.get(1, "a") == "A"
+    assert cache.get(1, "c") == "C"
+
+
+def test_new_generation_drops_entries():
+    cache = AnswerCache(10, ttl_s=60)
+    cache.put(1, "q", "p", "old")
+    assert cache.get(2, "q") is None
+    assert cache.stats()["entries"] == 0
+    assert cache.generation == 2
+
+
+def test_calls_for_an_older_generation_are_ignored():
+    cache = AnswerCache(10, ttl_s=60)
+    cache.put(2, "q", "p", "new")
+    # A request that started before the swap finishes on generation 1.
+    cache.put(1, "q", "p", "stale")
+    assert cache.get(1, "q") is None
+    assert cache.get(2, "q") == "new"
+    assert cache.generation == 2
+
+
+def test_similar_questions_share_an_answer_above_the_threshold():
+    cache = AnswerCache(10, ttl_s=60, similarity=0.9)
+    cache.put(1, "q1", "p", "answer", embedding=np.array([1.0, 0.0]))
+    assert cache.get_similar(1, "p", np.array([0.95, 0.1])) == "answer"
+    assert cache.get_similar(1, "p", np.array([0.5, 0.5])) is None
+    # Different search parameters never match.
+    assert cache.get_similar(1, "other", np.array([1.0, 0.0])) is None
+    assert cache.stats()["similar_hits"] == 1
+
+
+def test_similarity_lookup_is_off_by_default():
+    cache = AnswerCache(10, ttl_s=60)
+    cache.put(1, "q1", "p", "answer", embedding=np.array([1.0, 0.0]))
+    assert cache.get_similar(1, "p", np.array([1.0, 0.0])) is None
+
+
+def test_disabled_cache_stores_nothing():
+    cache = AnswerCache(0, ttl_s=60)
+    cache.put(1, "q", "p", "answer")
+    assert cache.get(1, "q") is None
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,55 @@
+from app.chunk_store import ChunkStore, is_policy_chunk
+
+
+def _store(tmp_path):
+    store = ChunkStore(str(tmp_path / "chunks.sqlite"))
+    store.add_chunks([(0, "a.txt", 0, "a0"), (1, "a.txt", 1, "a1"), (2, "b.txt", 0, "b0")])
+    store.commit()
+    return store
+
+
+def test_get_many_returns_live_chunks(tmp_path):
+    store = _store(tmp_path)
+    chunks = store.get_many([2, 0, -1, 99])
+    assert sorted(chunks) == [0, 2]
+    assert chunks[0].file == "a.txt" and chunks[0].text == "a0"
+    assert chunks[2].file == "b.txt" and chunks[2].seq == 0
+
+
+def test_deleted_chunks_stay_visible_to_older_generations(tmp_path):
+    store = _store(tmp_path)
+    # a.txt disappears in generation 3; readers still on generation 2 resolve it.
+    assert store.delete_file("a.txt", 3) == [0, 1]
+    store.commit()
+    assert sorted(store.get_many([0, 1, 2], generation=2)) == [0, 1, 2]
+    assert sorted(store.get_many([0, 1, 2], generation=3)) == [2]
+    assert sorted(store.get_many([0, 1, 2])) == [2]
+    assert store.live_ids() == [2]
+
+
+def test_purge_removes_only_generations_no_reader_can_hold(tmp_path):
+    store = _store(tmp_path)
+    store.delete_file("a.txt", 3)
+    store.delete_file("b.txt", 5)
+    store.commit()
+    assert store.purge(4) == 2
+    # Rows deleted up to generation 4 are gone even for a reader claiming generation 2.
+    assert sorted(store.get_many([0, 1, 2], generation=2)) == [2]
+    assert sorted(store.get_many([0, 1, 2], generation=4)) == [2]
+    assert store.get_many([0, 1, 2], generation=5) == {}
+
+
+def test_reader_sees_committed_deletes(tmp_path):
+    store = _store(tmp_path)
+    reader = ChunkStore(store.path, readonly=True)
+    store.delete_file("b.txt", 2)
+    store.commit()
+    assert sorted(reader.get_many([0, 1, 2], generation=1)) == [0, 1, 2]
+    assert sorted(reader.get_many([0, 1, 2], generation=2)) == [0, 1]
+    reader.close()
+    store.close()
+
+
+def test_policy_markers_match_upper_cased_text():
+    assert is_policy_chunk("System identity and greetings policy")
+    assert not is_policy_chunk("Ask the NBS Assistant about leave")
@@ -0,0 +1,97 @@
+import numpy as np
+
+from app import ann, context
+from app.chunk_store import Chunk
+
+
+def _words(prefix: str, n: int) -> str:
+    return " ".join(f"{prefix}{k}" for k in range(n))
+
+
+def _chunks(*rows):
+    return {cid: Chunk(cid, fn, seq, text) for cid, fn, seq, text in rows}
+
+
+def _index(vectors):
+    ids = np.arange(len(vectors), dtype="int64")
+    index, _ = ann.build(np.asarray(vectors, dtype="float32"), ids, "flat")
+    return index
+
+
+def test_distance_cutoff_keeps_the_best_hit(monkeypatch):
+    monkeypatch.setattr(context, "CONTEXT_MAX_DISTANCE", 1.0)
+    chunks = _chunks((0, "a.txt", 0, _words("a", 10)), (1, "b.txt", 0, _words("b", 10)),
+                     (2, "c.txt", 0, _words("c", 10)))
+    out = context.assemble([0.5, 0.9, 1.2], [0, 1, 2], chunks)
+    assert out.stats["after_cutoff"] == 2
+    assert [p.file for p in out.passages] == ["a.txt", "b.txt"]
+
+    # Even a far best hit is kept, so the prompt is never left without context.
+    out = context.assemble([1.3, 1.4], [0, 1], chunks)
+    assert [p.file for p in out.passages] == ["a.txt"]
+
+
+def test_near_duplicates_are_dropped_by_text_without_vectors():
+    text = _words("w", 30)
+    chunks = _chunks((0, "a.txt", 0, text), (1, "b.txt", 0, text.replace("w29", "other")),
+                     (2, "c.txt", 0, _words("c", 30)))
+    out = context.assemble([0.1, 0.2, 0.3], [0, 1, 2], chunks)
+    assert out.stats["after_dedup"] == 2
+    assert [p.file for p in out.passages] == ["a.txt", "c.txt"]
+
+
+def test_near_duplicates_are_dropped_by_vector():
+    chunks = _chunks((0, "a.txt", 0, _words("a", 10)), (1, "b.txt", 0, _words("b", 10)),
+                     (2, "c.txt", 0, _words("c", 10)))
+    index = _index([[1, 0, 0], [0.99, 0.01, 0], [0, 1, 0]])
+    out = context.assemble([0.1, 0.2, 0.3], [0, 1, 2], chunks, index=index)
+    assert out.stats["after_dedup"] == 2
+    assert [p.file for p in out.passages] == ["a.txt", "c.txt"]
+
+
+def test_mmr_prefers_a_diverse_hit(monkeypatch):
+    chunks = _chunks((0, "a.txt", 0, _words("a", 10)), (1, "b.txt", 0, _words("b", 10)),
+                     (2, "c.txt", 0, _words("c", 10)))
+    index = _index([[1, 0, 0], [0.93, 0.37, 0], [0.6, 0, 0.8]])
+
+    monkeypatch.setattr(context, "CONTEXT_MMR_LAMBDA", 0.5)
+    out = context.assemble([0.1, 0.2, 0.4], [0, 1, 2], chunks, index=index, max_chunks=2)
+    assert [p.file for p in out.passages] == ["a.txt", "c.txt"]
+
+    monkeypatch.setattr(context, "CONTEXT_MMR_LAMBDA", 1.0)
+    out = context.assemble([0.1, 0.2, 0.4], [0, 1, 2], chunks, index=index, max_chunks=2)
+    assert [p.file for p in out.passages] == ["a.txt", "b.txt"]
+
+
+def test_chunks_adjacent_in_a_file_are_merged_by_seq():
+    # Ids are not consecutive (the file was re-indexed between other files); seq is.
+    chunks = _chunks((10, "a.txt", 1, "second part. "), (4, "a.txt", 0, "first part. "),
+                     (20, "a.txt", 3, "fourth part. "), (7, "b.txt", 2, _words("b", 10)))
+    out = context.assemble([0.1, 0.2, 0.3, 0.4], [10, 4, 20, 7], chunks)
+    # Passages keep the rank of their best member.
+    assert [(p.file, p.chunk_ids) for p in out.passages] == [("a.txt", [4, 10]), ("a.txt", [20]),
+                                                             ("b.txt", [7])]
+    assert out.passages[0].text == "first part. second part. "
+    assert out.passages[0].distance == np.float32(0.1)
+
+
+def test_token_budget_truncates_the_last_passage():
+    chunks = _chunks((0, "a.txt", 0, _words("a", 30)), (1, "b.txt", 0, _words("b", 60)))
+    out = context.assemble([0.1, 0.2], [0, 1], chunks, max_tokens=70)
+    assert out.stats["truncated"] is True
+    assert out.stats["context_tokens"] <= 70
+    assert out.passages[0].text == _words("a", 30)
+    assert out.passages[1].text == _words("b", 40)
+
+
+def test_token_budget_drops_a_passage_too_short_to_be_useful():
+    chunks = _chunks((0, "a.txt", 0, _words("a", 30)), (1, "b.txt", 0, _words("b", 60)))
+    out = context.assemble([0.1, 0.2], [0, 1], chunks, max_tokens=30 + context.MIN_PASSAGE_TOKENS - 1)
+    assert out.stats["truncated"] is True
+    assert [p.file for p in out.passages] == ["a.txt"]
+    assert out.text == _words("a", 30)
+
+
+def test_truncate_tokens_backs_off_to_a_sentence_end():
+    text = "One two three four five six seven. Eight nine ten eleven"
+    assert context.truncate_tokens(text, 10) == "One two three four five six seven."
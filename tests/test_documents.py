@@ -0,0 +1,34 @@
+import random
+
+from app.documents import chunk_text_cdc, chunk_text_fixed
+
+
+def _text(seed: int = 0, paragraphs: int = 20) -> str:
+    rng = random.Random(seed)
+    vocab = [f"word{i}" for i in range(500)]
+    return "\n\n".join(" ".join(rng.choice(vocab) for _ in range(rng.randint(40, 120)))
+                       for _ in range(paragraphs))
+
+
+def test_cdc_chunks_cover_the_text_within_size_bounds():
+    text = _text()
+    chunks = chunk_text_cdc(text, 500)
+    assert "".join(chunks) == text
+    assert all(len(c) <= 1000 for c in chunks)
+    assert all(len(c) >= 250 for c in chunks[:-1])
+
+
+def test_cdc_boundaries_are_stable_after_an_edit():
+    text = _text()
+    middle = len(text) // 2
+    edited = text[:middle] + " inserted words here " + text[middle:]
+    before, after = chunk_text_cdc(text, 500), chunk_text_cdc(edited, 500)
+    # Only the chunks around the edit change; fixed-size chunks all shift after it.
+    assert len(set(before) - set(after)) <= 2
+    fixed_before, fixed_after = chunk_text_fixed(text, 500), chunk_text_fixed(edited, 500)
+    assert len(set(fixed_before) - set(fixed_after)) > len(fixed_before) // 3
+
+
+def test_cdc_splits_a_text_without_word_breaks_at_the_cap():
+    chunks = chunk_text_cdc("x" * 2500, 500)
+    assert [len(c) for c in chunks] == [1000, 1000, 500]
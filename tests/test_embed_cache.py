@@ -0,0 +1,50 @@
+import numpy as np
+
+from app import embed_cache
+from app.embed_cache import EmbeddingCache
+
+
+class _Encoder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return np.array([[float(len(t)), 1.0] for t in texts], dtype="float32")
+
+
+def _cache(tmp_path, model="m"):
+    return EmbeddingCache(str(tmp_path / "cache.sqlite"), model)
+
+
+def test_only_misses_are_encoded_and_counted(tmp_path):
+    cache, enc = _cache(tmp_path), _Encoder()
+    first = cache.encode(["a", "bb", "a"], enc)
+    assert enc.calls == [["a", "bb"]]  # duplicates in a batch are embedded once
+    assert cache.stats() == {"hits": 0, "misses": 3, "hit_rate": 0.0}
+
+    second = cache.encode(["bb", "ccc"], enc)
+    assert enc.calls[-1] == ["ccc"]
+    assert cache.stats() == {"hits": 1, "misses": 4, "hit_rate": 0.2}
+    np.testing.assert_array_equal(second[0], first[1])
+
+
+def test_entries_are_keyed_by_model(tmp_path):
+    _cache(tmp_path, "m").encode(["a"], _Encoder())
+    other, enc = _cache(tmp_path, "m@onnx"), _Encoder()
+    other.encode(["a"], enc)
+    assert enc.calls == [["a"]]
+    assert other.lookup(["a", "b"])[1] is None
+
+
+def test_prune_drops_least_recently_used_entries(tmp_path, monkeypatch):
+    now = [1000]
+    monkeypatch.setattr(embed_cache.time, "time", lambda: now[0])
+    cache, enc = _cache(tmp_path), _Encoder()
+    for text in ("a", "b", "c"):
+        cache.encode([text], enc)
+        now[0] += 1
+    cache.encode(["a"], enc)  # a hit makes "a" the most recently used
+    assert cache.prune(0) == 0
+    assert cache.prune(2) == 1
+    assert [v is not None for v in cache.lookup(["a", "b", "c"])] == [True, False, True]